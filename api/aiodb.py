@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from psycopg2 import connect, Error, OperationalError
+from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE
+
+from api.db import PoolTimeout, connect_kwargs, pool_settings
+from api.metrics import current_timer, phase
+
+
+async def wait_ready(conn):
+    """Drive an asynchronous psycopg2 connection until its current operation completes.
+
+    Waits on the event loop for the socket instead of blocking the thread.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        state = conn.poll()
+        if state == POLL_OK:
+            return
+        if state == POLL_READ:
+            add, remove = loop.add_reader, loop.remove_reader
+        elif state == POLL_WRITE:
+            add, remove = loop.add_writer, loop.remove_writer
+        else:
+            raise OperationalError(f"Unexpected connection poll state: {state}")
+        ready = loop.create_future()
+        fd = conn.fileno()
+        add(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            remove(fd)
+
+
+async def fetchone(conn, query, params=None):
+    """Run ``query`` on an asynchronous connection and return its first row."""
+    timer = current_timer()
+    with phase("query"), conn.cursor() as cursor:
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        await wait_ready(conn)
+        if timer is not None:
+            timer.statement(query, time.perf_counter() - start, cursor)
+        return cursor.fetchone()
+
+
+class AsyncConnectionPool:
+    """A bounded pool of non-blocking PostgreSQL connections for one event loop.
+
+    Asynchronous psycopg2 connections always run in autocommit mode, so this
+    pool serves single-statement reads. Connections are reused LIFO, pinged
+    after ``validate_after`` idle seconds, closed after ``max_idle`` seconds,
+    and discarded whenever the block using them raises or is cancelled.
+    """
+
+    def __init__(self, connect_kwargs, max_size=10, acquire_timeout=5.0,
+                 max_idle=300.0, validate_after=30.0, **_):
+        self.connect_kwargs = connect_kwargs
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+        self.pid = os.getpid()
+        self._slots = asyncio.Semaphore(max_size)
+        self._idle = deque()  # (connection, returned_at), oldest on the left
+        self._in_use = 0
+        self._waiting = 0
+
+        self._acquires = 0
+        self._acquire_time_total = 0.0
+        self._acquire_time_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        """Check a connection out for the duration of an ``async with`` block."""
+        start = time.monotonic()
+        self._waiting += 1
+        try:
+            with phase("acquire"):
+                await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeout(
+                f"Timed out after {self.acquire_timeout}s waiting for a database connection"
+            ) from None
+        finally:
+            self._waiting -= 1
+
+        conn = None
+        self._in_use += 1
+        try:
+            with phase("acquire"):
+                conn = await self._checkout()
+            elapsed = time.monotonic() - start
+            self._acquires += 1
+            self._acquire_time_total += elapsed
+            self._acquire_time_max = max(self._acquire_time_max, elapsed)
+            yield conn
+        except BaseException:
+            if conn is not None:
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.append((conn, time.monotonic()))
+            self._in_use -= 1
+            self._slots.release()
+
+    def close(self):
+        """Close every idle connection."""
+        while self._idle:
+            self._discard(self._idle.popleft()[0])
+
+    def stats(self):
+        """Return a snapshot of pool usage for sizing and monitoring."""
+        acquires = self._acquires
+        return {
+            "pid": self.pid,
+            "max_size": self.max_size,
+            "size": self._in_use + len(self._idle),
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "acquires": acquires,
+            "timeouts": self._timeouts,
+            "created": self._created,
+            "discarded": self._discarded,
+            "acquire_time_avg_ms": round(self._acquire_time_total / acquires * 1000, 3) if acquires else 0.0,
+            "acquire_time_max_ms": round(self._acquire_time_max * 1000, 3),
+        }
+
+    async def _checkout(self):
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            self._discard(self._idle.popleft()[0])
+        while self._idle:
+            conn, returned_at = self._idle.pop()
+            if conn.closed:
+                self._discard(conn)
+                continue
+            if now - returned_at < self.validate_after:
+                return conn
+            try:
+                await fetchone(conn, "SELECT 1;")
+                return conn
+            except Error:
+                self._discard(conn)
+        conn = connect(async_=1, **self.connect_kwargs)
+        try:
+            await wait_ready(conn)
+        except BaseException:
+            conn.close()
+            raise
+        self._created += 1
+        return conn
+
+    def _discard(self, conn):
+        self._discarded += 1
+        try:
+            conn.close()
+        except Error:
+            pass
+
+
+_pool = None
+
+
+def get_async_pool():
+    """Return this process's asynchronous pool, creating it on first use or after a fork."""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        _pool = AsyncConnectionPool(connect_kwargs(), **pool_settings())
+    return _pool
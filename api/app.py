@@ -0,0 +1,31 @@
+import os
+
+from dotenv import load_dotenv
+from flask import Flask
+
+from api import db
+from api.metrics import instrument_app
+
+
+def create_app(config=None):
+    """Create the API's Flask app.
+
+    Settings come from the environment (and a local ``.env`` file), overridden
+    by ``config``. Creating the app never touches the database: ``DATABASE_URL``
+    is parsed, and connections opened, when the first request needs one.
+    """
+    # Load environment variables from .env (for local development)
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.config["DATABASE_URL"] = os.getenv("DATABASE_URL")
+    app.config["SLOW_REQUEST_MS"] = float(os.getenv("SLOW_REQUEST_MS", 0))
+    app.config.from_mapping(config or {})
+    # The connection pool belongs to the process, so the last app created picks the database
+    db.configure(app.config["DATABASE_URL"])
+
+    from api.routes import bp
+
+    instrument_app(app)
+    app.register_blueprint(bp)
+    return app
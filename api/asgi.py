@@ -0,0 +1,332 @@
+import asyncio
+import io
+import sys
+
+import anyio
+from dotenv import load_dotenv
+from psycopg2 import Error
+from werkzeug.exceptions import HTTPException
+
+# Modules below read their settings when imported, before create_app would load .env
+load_dotenv()
+
+from api.aiodb import fetchone, get_async_pool
+from api.app import create_app
+from api.cache import vin_cache
+from api.changes import HEARTBEAT_SECONDS, change_feed, open_stream
+from api.db import PoolTimeout
+from api.metrics import begin_request, end_request, phase
+from api.models import SELECT_VEHICLE_VERSION
+from api.routes import start_notification_listener
+from api.serializers import vehicle_layout
+
+flask_app = create_app()
+
+
+JSON_HEADERS = [(b"content-type", b"application/json")]
+
+
+def _json(payload, status):
+    """Serialize ``payload`` exactly as the Flask app's ``jsonify`` does."""
+    return status, (flask_app.json.dumps(payload, separators=(",", ":")) + "\n").encode(), JSON_HEADERS
+
+
+async def home(scope, receive):
+    """Home route to verify the API is running."""
+    return _json({"message": "Welcome to the Vehicles API"}, 200)
+
+
+async def _load_vehicle(vin):
+    """Fetch a vehicle as ``(body, row_version)``, or return None if it does not exist."""
+    async with get_async_pool().connection() as conn:
+        row = await fetchone(conn, SELECT_VEHICLE_VERSION, (vin,))
+    if not row:
+        return None
+    with phase("serialize"):
+        return vehicle_layout.encode(row[:-1]), row[-1]
+
+
+# Loads started on behalf of a request; they finish even if that request is cancelled
+_loads = set()
+
+
+def _finish_load(vin, flight, task):
+    _loads.discard(task)
+    if task.cancelled():
+        vin_cache.complete_load(vin, flight, error=asyncio.CancelledError())
+    elif task.exception() is not None:
+        vin_cache.complete_load(vin, flight, error=task.exception())
+    else:
+        vin_cache.complete_load(vin, flight, task.result())
+
+
+async def _cached_vehicle(vin):
+    """Read-through ``vin_cache`` lookup that waits on the loop rather than a thread."""
+    value, flight, leader = vin_cache.begin_load(vin)
+    if flight is None:
+        return value
+    if leader:
+        task = asyncio.ensure_future(_load_vehicle(vin))
+        _loads.add(task)
+        task.add_done_callback(lambda task: _finish_load(vin, flight, task))
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    vin_cache.on_complete(flight, lambda: loop.call_soon_threadsafe(
+        lambda: done.done() or done.set_result(None)
+    ))
+    await done
+    return flight.result()
+
+
+async def get_vehicle_by_vin(scope, receive, vin):
+    """Fetch a vehicle by VIN."""
+    try:
+        vehicle = await _cached_vehicle(vin)
+        if vehicle is None:
+            return _json({"error": "Vehicle not found"}, 404)
+
+        body, version = vehicle
+        return 200, body, JSON_HEADERS + [(b"etag", f'"{version}"'.encode())]
+    except Error as e:
+        return _json({"error": "Internal Server Error", "message": str(e)}, 500)
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _change_events(position, opening, receive):
+    """Yield a subscriber's Server-Sent Events until the client disconnects."""
+    loop = asyncio.get_running_loop()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        yield opening
+        while True:
+            events = change_feed.buffered(position)
+            if events is None:
+                # Resuming from before the buffer: catch up from the change log on a worker thread
+                frames, position = await anyio.to_thread.run_sync(change_feed.read, position)
+                if frames:
+                    yield b"".join(frames)
+                continue
+            if events:
+                position = events[-1][0]
+                yield b"".join(frame for _, frame in events)
+                continue
+
+            changed = loop.create_future()
+
+            def wake():
+                loop.call_soon_threadsafe(lambda: changed.done() or changed.set_result(None))
+
+            if not change_feed.add_waiter(position, wake):
+                continue
+            try:
+                done, _ = await asyncio.wait(
+                    {changed, disconnected}, timeout=HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                change_feed.remove_waiter(wake)
+            if disconnected in done:
+                return
+            if not done:
+                yield b": keepalive\n\n"
+    finally:
+        disconnected.cancel()
+
+
+async def get_vehicle_changes(scope, receive):
+    """Stream vehicle changes as Server-Sent Events for as long as the client stays connected."""
+    last_event_id = None
+    for name, value in scope["headers"]:
+        if name == b"last-event-id":
+            last_event_id = value.decode("latin1")
+    try:
+        position, opening = await anyio.to_thread.run_sync(open_stream, last_event_id)
+    except ValueError:
+        return _json({"error": "Bad Request", "message": "Invalid Last-Event-ID."}, 400)
+    except Error as e:
+        return _json({"error": "Internal Server Error", "message": str(e)}, 500)
+    return 200, _change_events(position, opening, receive), [
+        (b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+    ]
+
+
+# Flask endpoint -> native coroutine serving its GET requests, called with the ASGI scope, receive and
+# URL arguments and returning (status, body, headers), where body is bytes or an async iterator of bytes
+ASYNC_HANDLERS = {
+    "api.home": home,
+    "api.get_vehicle_by_vin": get_vehicle_by_vin,
+    "api.get_vehicle_changes": get_vehicle_changes,
+}
+
+
+class _RequestBody(io.RawIOBase):
+    """``wsgi.input`` that pulls the ASGI request body from the event loop on demand."""
+
+    def __init__(self, receive):
+        self._receive = receive
+        self._pending = b""
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and self._more:
+            message = anyio.from_thread.run(self._receive)
+            if message["type"] == "http.disconnect":
+                self._more = False
+                break
+            self._pending = message.get("body", b"")
+            self._more = message.get("more_body", False)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def _environ(scope, body):
+    script_name = scope.get("root_path", "")
+    path_info = scope["path"]
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name.encode().decode("latin1"),
+        "PATH_INFO": path_info.encode().decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for name, value in scope["headers"]:
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin1")
+        environ[name] = environ[name] + "," + value if name in environ else value
+    return environ
+
+
+class WSGIBridge:
+    """Run a WSGI app for an ASGI request on a worker thread.
+
+    The request body is read from the loop as the app consumes it, and each
+    response chunk is sent before the next one is produced, so streamed
+    uploads and downloads stay streamed. The app's iterable is always closed.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        await anyio.to_thread.run_sync(self._run, scope, receive, send)
+
+    def _run(self, scope, receive, send):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [int(status.split(" ", 1)[0]), [
+                (name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers
+            ]]
+
+        def send_start():
+            status, headers = started
+            anyio.from_thread.run(send, {"type": "http.response.start", "status": status, "headers": headers})
+            started.append(True)
+
+        response = self.wsgi_app(_environ(scope, _RequestBody(receive)), start_response)
+        try:
+            for chunk in response:
+                if not chunk:
+                    continue
+                if len(started) == 2:
+                    send_start()
+                anyio.from_thread.run(send, {"type": "http.response.body", "body": chunk, "more_body": True})
+            if len(started) == 2:
+                send_start()
+            anyio.from_thread.run(send, {"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+
+
+_bridge = WSGIBridge(flask_app)
+_routes = flask_app.url_map.bind("localhost")
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            get_async_pool().close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """Serve the Flask app's routes on an event loop.
+
+    Requests are routed with the Flask app's own URL map. GETs for endpoints
+    in ``ASYNC_HANDLERS`` are served natively with a non-blocking database
+    connection, and change streams wait on the loop rather than a thread;
+    every other request, including redirects, 404s and 405s, is
+    handed to the Flask app on a worker thread.
+    """
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    handler = None
+    if scope["method"] == "GET":
+        try:
+            rule, args = _routes.match(scope["path"], "GET", return_rule=True)
+            handler = ASYNC_HANDLERS.get(rule.endpoint)
+        except HTTPException:
+            pass
+    if handler is None:
+        await _bridge(scope, receive, send)
+        return
+
+    start_notification_listener()
+    timer = begin_request()
+    status = 500
+    try:
+        try:
+            status, body, headers = await handler(scope, receive, **args)
+        except PoolTimeout as e:
+            status, body, headers = _json({"error": "Service Unavailable", "message": str(e)}, 503)
+        if isinstance(body, bytes):
+            headers = headers + [(b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if isinstance(body, bytes):
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            async for chunk in body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await body.aclose()
+    finally:
+        end_request(timer, "GET", rule.rule, status, scope["path"])
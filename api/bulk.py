@@ -0,0 +1,151 @@
+import io
+
+from psycopg2 import sql
+
+from api.models import NEXT_ROW_VERSION, VEHICLE_COLUMNS
+
+CONFLICT_POLICIES = ("fail", "skip", "upsert")
+
+STAGING_TABLE_QUERY = """
+CREATE TEMP TABLE vehicles_bulk (
+    idx INT NOT NULL,
+    vin VARCHAR(17) NOT NULL,
+    manufacturer_name VARCHAR(255) NOT NULL,
+    description TEXT,
+    horse_power INT,
+    model_name VARCHAR(255) NOT NULL,
+    model_year INT NOT NULL,
+    purchase_price DECIMAL(10, 2),
+    fuel_type VARCHAR(50) NOT NULL
+) ON COMMIT DROP;
+"""
+
+_columns = sql.SQL(', ').join(map(sql.Identifier, VEHICLE_COLUMNS))
+_updatable = [sql.Identifier(column) for column in VEHICLE_COLUMNS if column != "vin"]
+
+COPY_QUERY = sql.SQL("COPY vehicles_bulk (idx, {columns}) FROM STDIN WITH (FORMAT csv);").format(columns=_columns)
+
+# Returns the VINs that were overwritten rather than inserted
+UPSERT_QUERY = sql.SQL("""
+    WITH written AS (
+        INSERT INTO vehicles_schema.vehicles ({columns})
+        SELECT {columns} FROM vehicles_bulk ORDER BY vin
+        ON CONFLICT (vin) DO UPDATE SET ({updatable}) = ROW({excluded}), row_version = {next_version}
+        RETURNING vin, (xmax = 0) AS inserted
+    )
+    SELECT vin FROM written WHERE NOT inserted;
+""").format(
+    columns=_columns,
+    updatable=sql.SQL(', ').join(_updatable),
+    excluded=sql.SQL(', ').join(sql.SQL("EXCLUDED.{}").format(column) for column in _updatable),
+    next_version=sql.SQL(NEXT_ROW_VERSION),
+)
+
+INSERT_NEW_QUERY = sql.SQL("""
+    WITH written AS (
+        INSERT INTO vehicles_schema.vehicles ({columns})
+        SELECT {columns} FROM vehicles_bulk ORDER BY vin
+        ON CONFLICT (vin) DO NOTHING
+        RETURNING vin
+    )
+    SELECT s.idx FROM vehicles_bulk s
+    WHERE NOT EXISTS (SELECT 1 FROM written w WHERE w.vin = s.vin)
+    ORDER BY s.idx;
+""").format(columns=_columns)
+
+
+def _copy_field(value):
+    """Format a value as a CSV field for COPY, keeping NULL distinct from ''."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+
+class BulkLoader:
+    """Stage validated vehicles with COPY and merge them into the table at once.
+
+    Rows are buffered and copied into a temporary staging table in chunks of
+    ``chunk_size``; ``merge`` or ``upsert`` then writes them all with a single
+    ``INSERT ... SELECT ... ON CONFLICT`` in the caller's transaction.
+    """
+
+    def __init__(self, cursor, chunk_size=5000):
+        self.cursor = cursor
+        self.chunk_size = chunk_size
+        self.staged = 0
+        self._buffer = io.StringIO()
+        self._pending = 0
+        cursor.execute(STAGING_TABLE_QUERY)
+
+    def add(self, index, data):
+        """Stage one validated vehicle, remembering its position in the request."""
+        fields = [str(index)]
+        fields.extend(_copy_field(data.get(column)) for column in VEHICLE_COLUMNS)
+        self._buffer.write(",".join(fields))
+        self._buffer.write("\n")
+        self._pending += 1
+        if self._pending >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Copy buffered rows into the staging table."""
+        if not self._pending:
+            return
+        self._buffer.seek(0)
+        self.cursor.copy_expert(COPY_QUERY, self._buffer)
+        self.staged += self._pending
+        self._buffer = io.StringIO()
+        self._pending = 0
+
+    def existing_rows(self, columns):
+        """Lock and return ``columns`` of the stored vehicles the staged rows share a VIN with."""
+        self.flush()
+        self.cursor.execute(sql.SQL("""
+            SELECT {columns} FROM vehicles_schema.vehicles
+            WHERE vin IN (SELECT vin FROM vehicles_bulk) ORDER BY vin FOR UPDATE;
+        """).format(columns=sql.SQL(', ').join(map(sql.Identifier, columns))))
+        return self.cursor.fetchall()
+
+    def staged_rows(self, columns, exclude=()):
+        """Return ``columns`` of the staged rows, leaving out the request indexes in ``exclude``."""
+        self.flush()
+        self.cursor.execute(sql.SQL("""
+            SELECT {columns} FROM vehicles_bulk WHERE NOT (idx = ANY(%s));
+        """).format(columns=sql.SQL(', ').join(map(sql.Identifier, columns))), (list(exclude),))
+        return self.cursor.fetchall()
+
+    def upsert(self, columns):
+        """Write the staged rows, overwriting existing VINs; return ``(inserted, updated, previous)``.
+
+        ``previous`` holds ``columns`` of every overwritten vehicle as it was
+        before. They are read and locked just ahead of the upsert. A VIN that
+        another transaction commits in between is overwritten without them, so
+        then the upsert is undone and tried again.
+        """
+        self.flush()
+        if not self.staged:
+            return 0, 0, []
+        while True:
+            self.cursor.execute("SAVEPOINT bulk_upsert;")
+            previous = {row[0]: row[1:] for row in self.existing_rows(("vin",) + tuple(columns))}
+            self.cursor.execute(UPSERT_QUERY)
+            updated = [row[0] for row in self.cursor.fetchall()]
+            if all(vin in previous for vin in updated):
+                self.cursor.execute("RELEASE SAVEPOINT bulk_upsert;")
+                return self.staged - len(updated), len(updated), [previous[vin] for vin in updated]
+            self.cursor.execute("ROLLBACK TO SAVEPOINT bulk_upsert;")
+
+    def merge(self, on_conflict):
+        """Write the staged rows without touching existing VINs; return ``(inserted, 0, duplicate_indexes)``.
+
+        The request indexes of the rows whose VIN already existed are returned;
+        ``upsert`` overwrites them instead.
+        """
+        self.flush()
+        if not self.staged:
+            return 0, 0, []
+        self.cursor.execute(INSERT_NEW_QUERY)
+        duplicates = [row[0] for row in self.cursor.fetchall()]
+        return self.staged - len(duplicates), 0, duplicates
@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Invalidation payload meaning "drop every cached VIN"
+INVALIDATE_ALL = "*"
+
+_MISSING = object()
+
+
+class _Flight:
+    """An in-progress load that concurrent misses on the same key wait for."""
+
+    __slots__ = ("event", "value", "error", "stale", "callbacks")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False
+        self.callbacks = []  # None once the load has completed
+
+    def result(self):
+        """Return the loaded value, re-raising the load's error if it failed."""
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class VinCache:
+    """A bounded LRU cache with per-entry TTLs and single-flight loading.
+
+    Values are serialized vehicle responses keyed by VIN. A loaded value of
+    ``None`` records that the VIN does not exist and is kept for the shorter
+    ``negative_ttl``. Concurrent misses on the same VIN share one load, and a
+    load that races with an invalidation is returned but never stored.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60.0, negative_ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # vin -> (value, expires_at), least recent first
+        self._flights = {}
+
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` on a miss."""
+        value, flight, leader = self.begin_load(key)
+        if flight is None:
+            return value
+        if not leader:
+            flight.event.wait()
+            return flight.result()
+        try:
+            value = loader()
+        except BaseException as e:
+            self.complete_load(key, flight, error=e)
+            raise
+        self.complete_load(key, flight, value)
+        return value
+
+    def begin_load(self, key):
+        """Look ``key`` up without blocking.
+
+        Returns ``(value, None, False)`` on a hit. On a miss returns
+        ``(None, flight, leader)``: the leader loads the value and hands it to
+        ``complete_load``; everyone else waits for ``flight`` to complete.
+        """
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not _MISSING:
+                return value, None, False
+            self._misses += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._coalesced += 1
+                return None, flight, False
+            flight = self._flights[key] = _Flight()
+            return None, flight, True
+
+    def complete_load(self, key, flight, value=None, error=None):
+        """Publish the result of a leader's load and wake its waiters."""
+        with self._lock:
+            if error is None and not flight.stale:
+                self._store_locked(key, value)
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.value = value
+            flight.error = error
+            callbacks, flight.callbacks = flight.callbacks, None
+        flight.event.set()
+        for callback in callbacks:
+            callback()
+
+    def on_complete(self, flight, callback):
+        """Call ``callback()`` once ``flight`` has completed, from whichever thread completes it."""
+        with self._lock:
+            if flight.callbacks is not None:
+                flight.callbacks.append(callback)
+                return
+        callback()
+
+    def invalidate(self, key):
+        """Drop ``key`` and stop any in-flight load from caching its result."""
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop(key, None)
+            flight = self._flights.pop(key, None)
+            if flight is not None:
+                flight.stale = True
+
+    def clear(self):
+        """Drop every entry and stop all in-flight loads from being cached."""
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+            for flight in self._flights.values():
+                flight.stale = True
+            self._flights.clear()
+
+    def stats(self):
+        """Return cache effectiveness counters."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "negative_hits": self._negative_hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._expirations += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        if value is None:
+            self._negative_hits += 1
+        else:
+            self._hits += 1
+        return value
+
+    def _store_locked(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+
+vin_cache = VinCache(
+    max_entries=int(os.getenv("VIN_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("VIN_CACHE_TTL", 60)),
+    negative_ttl=float(os.getenv("VIN_CACHE_NEGATIVE_TTL", 5)),
+)
+
+# PostgreSQL NOTIFY channel used to invalidate sibling workers' caches.
+# Setting it to an empty string disables cross-worker invalidation.
+INVALIDATION_CHANNEL = os.getenv("VIN_CACHE_INVALIDATION_CHANNEL", "vehicle_cache_invalidation")
+
+
+def publish_invalidation(cursor, vin):
+    """Queue a cross-worker invalidation, delivered when the transaction commits."""
+    if INVALIDATION_CHANNEL:
+        cursor.execute("SELECT pg_notify(%s, %s);", (INVALIDATION_CHANNEL, vin))
+
+
+def publish_invalidations(cursor, vins):
+    """Queue cross-worker invalidations for many VINs with a single statement."""
+    if INVALIDATION_CHANNEL and vins:
+        cursor.execute("SELECT pg_notify(%s, vin) FROM unnest(%s::text[]) AS vin;", (INVALIDATION_CHANNEL, list(vins)))
+
+
+def handle_invalidation(payload):
+    """Apply an invalidation received from another worker."""
+    if payload == INVALIDATE_ALL:
+        vin_cache.clear()
+    else:
+        vin_cache.invalidate(payload)
@@ -0,0 +1,304 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+
+from psycopg2 import connect, Error
+
+from api.db import connect_kwargs, db_connection
+from api.models import VEHICLE_COLUMNS
+from api.serializers import vehicle_layout
+
+# NOTIFY channel the vehicles table's change triggers signal after each writing statement
+CHANGES_CHANNEL = "vehicle_changes"
+# Recent events each process keeps in memory for its subscribers
+FEED_BUFFER_SIZE = int(os.getenv("CHANGE_FEED_BUFFER_SIZE", 10000))
+# Events read per query from the change log
+CHANGES_BATCH = 1000
+# Hours change log rows are kept for subscribers resuming with Last-Event-ID
+CHANGE_LOG_RETENTION_HOURS = float(os.getenv("CHANGE_LOG_RETENTION_HOURS", 24))
+# Seconds between comment lines keeping an idle stream open through proxies
+HEARTBEAT_SECONDS = 15.0
+# Milliseconds an EventSource waits before reconnecting
+RETRY_MS = 1000
+
+# Statement-level triggers log every inserted, updated and deleted row, and
+# NOTIFY once per writing transaction. A change's position is (xid, id): the
+# writing transaction's ID, then the log row's ID. Readers only take changes
+# whose transactions are older than their snapshot's xmin, so every change at
+# or before a position a reader has passed is already committed and visible.
+CHANGE_LOG_QUERY = """
+CREATE TABLE IF NOT EXISTS vehicles_schema.vehicle_changes (
+    id BIGSERIAL PRIMARY KEY,
+    xid BIGINT NOT NULL DEFAULT pg_current_xact_id()::text::bigint,
+    op VARCHAR(6) NOT NULL,
+    vin VARCHAR(17) NOT NULL,
+    row_version BIGINT NOT NULL,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS vehicle_changes_position_idx ON vehicles_schema.vehicle_changes (xid, id);
+CREATE INDEX IF NOT EXISTS vehicle_changes_changed_at_idx ON vehicles_schema.vehicle_changes (changed_at);
+
+-- Newest position removed by pruning; subscribers resuming from before it have missed changes
+CREATE TABLE IF NOT EXISTS vehicles_schema.vehicle_changes_pruned (
+    xid BIGINT NOT NULL,
+    id BIGINT NOT NULL
+);
+INSERT INTO vehicles_schema.vehicle_changes_pruned (xid, id)
+SELECT 0, 0 WHERE NOT EXISTS (SELECT 1 FROM vehicles_schema.vehicle_changes_pruned);
+
+CREATE OR REPLACE FUNCTION vehicles_schema.log_vehicle_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO vehicles_schema.vehicle_changes (op, vin, row_version)
+        SELECT 'delete', vin, row_version FROM old_rows;
+    ELSE
+        INSERT INTO vehicles_schema.vehicle_changes (op, vin, row_version)
+        SELECT lower(TG_OP), vin, row_version FROM new_rows;
+    END IF;
+    IF FOUND THEN
+        PERFORM pg_notify('vehicle_changes', '');
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS vehicles_log_inserts ON vehicles_schema.vehicles;
+CREATE TRIGGER vehicles_log_inserts AFTER INSERT ON vehicles_schema.vehicles
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION vehicles_schema.log_vehicle_changes();
+DROP TRIGGER IF EXISTS vehicles_log_updates ON vehicles_schema.vehicles;
+CREATE TRIGGER vehicles_log_updates AFTER UPDATE ON vehicles_schema.vehicles
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION vehicles_schema.log_vehicle_changes();
+DROP TRIGGER IF EXISTS vehicles_log_deletes ON vehicles_schema.vehicles;
+CREATE TRIGGER vehicles_log_deletes AFTER DELETE ON vehicles_schema.vehicles
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION vehicles_schema.log_vehicle_changes();
+"""
+
+_FRONTIER = "pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+# Changes after a position, each with the vehicle as it is now if that is the version the change wrote
+CHANGES_QUERY = f"""
+SELECT c.xid, c.id, c.op, c.vin, c.row_version, {", ".join("v." + column for column in VEHICLE_COLUMNS)}
+FROM vehicles_schema.vehicle_changes c
+LEFT JOIN vehicles_schema.vehicles v ON v.vin = c.vin AND v.row_version = c.row_version AND c.op <> 'delete'
+WHERE (c.xid, c.id) > (%s, %s) AND c.xid < {_FRONTIER}
+ORDER BY c.xid, c.id
+LIMIT %s;
+"""
+# Whether changes exist that are held back by a transaction still in progress
+HELD_BACK_QUERY = f"SELECT EXISTS (SELECT 1 FROM vehicles_schema.vehicle_changes WHERE xid >= {_FRONTIER});"
+PRUNE_QUERY = """
+WITH pruned AS (
+    DELETE FROM vehicles_schema.vehicle_changes WHERE changed_at < now() - %s * interval '1 hour' RETURNING xid, id
+), newest AS (
+    SELECT xid, id FROM pruned ORDER BY xid DESC, id DESC LIMIT 1
+)
+UPDATE vehicles_schema.vehicle_changes_pruned p SET xid = newest.xid, id = newest.id
+FROM newest WHERE (newest.xid, newest.id) > (p.xid, p.id);
+"""
+
+
+def format_position(position):
+    return "%d-%d" % position
+
+
+def parse_position(event_id):
+    """Parse an event ID sent back in Last-Event-ID, raising ValueError if it is malformed."""
+    xid, _, change_id = event_id.strip().partition("-")
+    return int(xid), int(change_id)
+
+
+def read_changes(cursor, after, limit=CHANGES_BATCH):
+    """Return up to ``limit`` ``(position, frame)`` pairs for the changes after ``after``."""
+    cursor.execute(CHANGES_QUERY, (after[0], after[1], limit))
+    events = []
+    for row in cursor.fetchall():
+        xid, change_id, op, vin, row_version = row[:5]
+        vehicle = vehicle_layout.encode_row(row[5:]) if row[5] is not None else "null"
+        events.append(((xid, change_id), (
+            f'id: {xid}-{change_id}\ndata: {{"op":"{op}","vin":{encode_basestring_ascii(vin)},'
+            f'"row_version":{row_version},"vehicle":{vehicle}}}\n\n'
+        ).encode()))
+    return events
+
+
+def read_frontier(cursor):
+    """Return the position every later change will follow."""
+    cursor.execute(f"SELECT {_FRONTIER};")
+    return cursor.fetchone()[0], 0
+
+
+class ChangeFeed:
+    """Fans the vehicles change log out to this process's subscribers.
+
+    One thread per process reads new changes whenever the notification
+    listener relays a NOTIFY from the change triggers, and keeps the most
+    recent ``buffer_size`` as ready-made Server-Sent Events frames.
+    Subscribers read from that buffer, and only a subscriber resuming from
+    further back queries the change log itself.
+    """
+
+    def __init__(self, buffer_size=FEED_BUFFER_SIZE, poll_interval=0.5, idle_interval=30.0,
+                 prune_interval=3600.0):
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self.idle_interval = idle_interval
+        self.prune_interval = prune_interval
+        self.pid = None
+        self.head = None  # position of the newest change read
+        self._floor = None  # position just before the oldest buffered change
+        self._events = deque()  # (position, frame), oldest on the left
+        self._cond = threading.Condition()
+        self._waiters = set()
+        self._wake = threading.Event()
+
+    def wake(self, payload=None):
+        """Have the feed thread read new changes; the listener's callback for the changes channel."""
+        self._wake.set()
+
+    def start(self):
+        """Start this process's feed thread on first use or after a fork, returning the head position."""
+        with self._cond:
+            if self.pid != os.getpid():
+                with db_connection() as conn:
+                    with conn.cursor() as cursor:
+                        self.head = self._floor = read_frontier(cursor)
+                self._events.clear()
+                self._waiters.clear()
+                self.pid = os.getpid()
+                threading.Thread(target=self._run, name="change-feed", daemon=True).start()
+            return self.head
+
+    def buffered(self, position, limit=CHANGES_BATCH):
+        """Return the buffered ``(position, frame)`` pairs after ``position``, or None if it is older than the buffer."""
+        with self._cond:
+            if position < self._floor:
+                return None
+            start = bisect_right(self._events, position, key=lambda event: event[0])
+            return list(islice(self._events, start, start + limit))
+
+    def read(self, position, limit=CHANGES_BATCH):
+        """Return the frames of up to ``limit`` changes after ``position`` and the position of the last one."""
+        events = self.buffered(position, limit)
+        if events is None:
+            with self._cond:
+                floor = self._floor
+            with db_connection() as conn:
+                with conn.cursor() as cursor:
+                    events = read_changes(cursor, position, limit)
+            if not events:
+                # Nothing was logged between position and the buffer, so carry on from the buffer
+                return [], max(position, floor)
+        if not events:
+            return [], position
+        return [frame for _, frame in events], events[-1][0]
+
+    def wait(self, position, timeout):
+        """Block until a change after ``position`` has been read, returning False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.head > position, timeout)
+
+    def add_waiter(self, position, callback):
+        """Call ``callback()`` from the feed thread once a change after ``position`` has been read.
+
+        Returns False, without registering it, if one already has.
+        """
+        with self._cond:
+            if self.head > position:
+                return False
+            self._waiters.add(callback)
+            return True
+
+    def remove_waiter(self, callback):
+        with self._cond:
+            self._waiters.discard(callback)
+
+    def _append(self, events):
+        with self._cond:
+            self._events.extend(events)
+            while len(self._events) > self.buffer_size:
+                self._floor = self._events.popleft()[0]
+            self.head = events[-1][0]
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, set()
+        for callback in waiters:
+            callback()
+
+    def _run(self):
+        conn = None
+        held_back = False
+        pruned_at = 0.0
+        while True:
+            self._wake.wait(self.poll_interval if held_back else self.idle_interval)
+            self._wake.clear()
+            try:
+                if conn is None:
+                    conn = connect(**connect_kwargs())
+                    conn.autocommit = True
+                with conn.cursor() as cursor:
+                    while True:
+                        events = read_changes(cursor, self.head)
+                        if events:
+                            self._append(events)
+                        if len(events) < CHANGES_BATCH:
+                            break
+                    # A transaction still writing holds back later changes, so look again soon
+                    cursor.execute(HELD_BACK_QUERY)
+                    held_back = cursor.fetchone()[0]
+                    if time.monotonic() - pruned_at > self.prune_interval:
+                        cursor.execute(PRUNE_QUERY, (CHANGE_LOG_RETENTION_HOURS,))
+                        pruned_at = time.monotonic()
+            except Error as e:
+                print(f"Change feed lost its database connection: {e}")
+                if conn is not None and not conn.closed:
+                    conn.close()
+                conn = None
+                held_back = True
+
+
+change_feed = ChangeFeed()
+
+
+def open_stream(last_event_id=None):
+    """Subscribe from ``last_event_id``, or from now, returning the position and the stream's opening bytes.
+
+    A subscriber resuming from before pruned changes is sent a ``reset``
+    event, after which it should re-fetch the vehicles it tracks.
+    Raises ValueError if ``last_event_id`` is malformed.
+    """
+    head = change_feed.start()
+    opening = f"retry: {RETRY_MS}\n".encode()
+    if last_event_id is None:
+        # An id without data sets the client's Last-Event-ID without dispatching an event
+        return head, opening + f"id: {format_position(head)}\n\n".encode()
+
+    position = parse_position(last_event_id)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT xid, id FROM vehicles_schema.vehicle_changes_pruned;")
+            pruned = cursor.fetchone()
+    if position < pruned:
+        return head, opening + f"id: {format_position(head)}\nevent: reset\ndata: {{}}\n\n".encode()
+    return position, opening + b"\n"
+
+
+def iter_stream(position, opening, max_seconds=None):
+    """Yield a subscriber's Server-Sent Events, blocking between changes, for at most ``max_seconds``."""
+    deadline = None if max_seconds is None else time.monotonic() + max_seconds
+    yield opening
+    while True:
+        frames, position = change_feed.read(position)
+        if frames:
+            yield b"".join(frames)
+            continue
+        timeout = HEARTBEAT_SECONDS
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                return
+        if not change_feed.wait(position, timeout):
+            yield b": keepalive\n\n"
@@ -0,0 +1,328 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from psycopg2 import connect, Error
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, cursor
+
+from api.metrics import current_timer, phase
+
+
+class PoolTimeout(Exception):
+    """Raised when no database connection frees up within the acquire timeout."""
+
+
+class TimedCursor(cursor):
+    """A cursor that charges statements and fetches to the current request's ``query`` phase."""
+
+    def _timed(self, method, *args, statement=None):
+        timer = current_timer()
+        if timer is None:
+            return method(*args)
+        previous = timer.current
+        timer.switch("query")
+        try:
+            return method(*args)
+        finally:
+            elapsed = timer.switch(previous)
+            if statement is not None:
+                timer.statement(statement, elapsed, self)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars, statement=query)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size, statement=sql)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __iter__(self):
+        # Fetch in itersize batches through fetchmany so server-side cursors are timed too
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of PostgreSQL connections owned by one process.
+
+    Connections are opened lazily up to ``max_size``, handed out LIFO so the
+    warmest connections get reused, pinged before reuse once they have sat idle
+    for ``validate_after`` seconds, and closed after ``max_idle`` seconds of
+    inactivity (never dropping below ``min_size``).
+    """
+
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, acquire_timeout=5.0,
+                 max_idle=300.0, validate_after=30.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size=%s max_size=%s" % (min_size, max_size))
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, returned_at), oldest on the left
+        self._size = 0  # open connections, idle and in use
+        self._in_use = 0
+        self._waiting = 0
+
+        self._acquires = 0
+        self._acquire_time_total = 0.0
+        self._acquire_time_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+    def getconn(self):
+        """Check a connection out of the pool, opening a new one if allowed."""
+        start = time.monotonic()
+        deadline = start + self.acquire_timeout
+        stale = []
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    stale.extend(self._reap_idle_locked(time.monotonic()))
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        conn, returned_at = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        for idle_conn in stale:
+                            self._close(idle_conn)
+                        raise PoolTimeout(
+                            f"Timed out after {self.acquire_timeout}s waiting for a database connection"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+
+        for idle_conn in stale:
+            self._close(idle_conn)
+
+        try:
+            if conn is not None and not self._is_usable(conn, returned_at):
+                self._close(conn)
+                with self._cond:
+                    self._discarded += 1
+                conn = None
+            if conn is None:
+                conn = connect(cursor_factory=TimedCursor, **self.connect_kwargs)
+                with self._cond:
+                    self._created += 1
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._acquires += 1
+            self._acquire_time_total += elapsed
+            self._acquire_time_max = max(self._acquire_time_max, elapsed)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Error:
+                discard = True
+
+        if discard or conn.closed:
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._discarded += 1
+                self._cond.notify()
+        else:
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._in_use -= 1
+                self._cond.notify()
+
+    def closeall(self):
+        """Close every idle connection; checked-out connections close on return."""
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Return a snapshot of pool usage for sizing and monitoring."""
+        with self._cond:
+            acquires = self._acquires
+            return {
+                "pid": self.pid,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "acquires": acquires,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "acquire_time_avg_ms": round(self._acquire_time_total / acquires * 1000, 3) if acquires else 0.0,
+                "acquire_time_max_ms": round(self._acquire_time_max * 1000, 3),
+            }
+
+    def _reap_idle_locked(self, now):
+        """Detach connections idle longer than max_idle; the caller closes them."""
+        stale = []
+        while (self._idle and self._size > self.min_size
+               and now - self._idle[0][1] > self.max_idle):
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._discarded += 1
+            stale.append(conn)
+        return stale
+
+    def _is_usable(self, conn, returned_at):
+        """Check a pooled connection, pinging it if it has been idle a while."""
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.validate_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except Error:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+
+_database_url = None
+_db_config = None
+_pool = None
+_pool_lock = threading.Lock()
+# Pools inherited from a parent process across fork(). Their sockets belong to
+# the parent, so they are kept referenced (never closed or garbage collected)
+# to stop the child from terminating the parent's sessions.
+_orphaned_pools = []
+
+
+def configure(database_url):
+    """Set the database this process connects to; the URL is parsed on first use."""
+    global _database_url, _db_config
+    _database_url = database_url
+    _db_config = None
+
+
+def configured():
+    """Return whether a database has been configured for this process."""
+    return bool(_database_url or os.getenv("DATABASE_URL"))
+
+
+def db_config():
+    """Return the connection parameters from the configured DATABASE_URL."""
+    global _db_config
+    if _db_config is None:
+        database_url = _database_url or os.getenv("DATABASE_URL")
+        if not database_url:
+            raise RuntimeError("DATABASE_URL environment variable not set")
+        parsed_url = urlparse(database_url)
+        _db_config = {
+            "dbname": parsed_url.path[1:],  # Remove leading '/'
+            "user": parsed_url.username,
+            "password": parsed_url.password,
+            "host": parsed_url.hostname,
+            "port": parsed_url.port,
+        }
+    return _db_config
+
+
+def connect_kwargs():
+    """Return the keyword arguments used to open a connection for this environment."""
+    # Determine SSL mode based on the environment
+    sslmode = "require" if os.getenv("ENV") == "production" else "disable"
+    return dict(db_config(), sslmode=sslmode)
+
+
+def get_db_connection():
+    """Establish a standalone (unpooled) database connection."""
+    try:
+        return connect(**connect_kwargs())
+    except Error as e:
+        print(f"Error connecting to the database: {e}")
+        raise
+
+
+def pool_settings():
+    """Read pool sizing and timeouts from the environment."""
+    return {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+        "acquire_timeout": float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 5)),
+        "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+        "validate_after": float(os.getenv("DB_POOL_VALIDATE_AFTER", 30)),
+    }
+
+
+def get_pool():
+    """Return this process's pool, creating it on first use or after a fork."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid != os.getpid():
+            _orphaned_pools.append(_pool)
+            _pool = None
+        if _pool is None:
+            _pool = ConnectionPool(connect_kwargs(), **pool_settings())
+        return _pool
+
+
+@contextmanager
+def db_connection():
+    """Check a connection out of the pool for the duration of a ``with`` block.
+
+    Any transaction left open (including after an exception) is rolled back
+    when the connection is returned; broken connections are discarded.
+    """
+    pool = get_pool()
+    with phase("acquire"):
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
@@ -0,0 +1,245 @@
+import importlib.util
+import io
+import os
+import queue
+import threading
+import zlib
+
+from psycopg2 import sql
+
+from api.db import db_connection
+from api.models import VEHICLE_COLUMNS
+
+# Media type of each export format
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Bytes of COPY output gathered into each chunk handed to the response
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 256 * 1024))
+# Chunks buffered between the COPY and a slow client; bounds an export's memory
+EXPORT_QUEUE_CHUNKS = 16
+# zlib level of gzip-encoded CSV and NDJSON exports; low levels keep up with COPY
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 1))
+# Rows per Parquet row group
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("EXPORT_PARQUET_ROW_GROUP_SIZE", 65536))
+
+# row_to_json builds compact JSON objects with the listing's keys, in order. In
+# CSV format with a quote and delimiter that JSON text never contains, COPY
+# writes them out verbatim, one per line. They decode to the listing's objects,
+# but non-ASCII text is written as UTF-8 where the listing writes \u escapes.
+_COPY_OPTIONS = {
+    "csv": "FORMAT csv, HEADER",
+    "ndjson": "FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02'",
+    "parquet": "FORMAT csv",
+}
+
+
+def build_copy_query(query, export_format):
+    """Wrap a ``build_vehicle_query`` SELECT in the COPY statement that exports it."""
+    if export_format == "ndjson":
+        query = sql.SQL("SELECT row_to_json(vehicles)::text FROM ({}) AS vehicles").format(query)
+    return sql.SQL("COPY ({}) TO STDOUT WITH ({})").format(query, sql.SQL(_COPY_OPTIONS[export_format]))
+
+
+class CopyStream:
+    """Runs a ``COPY ... TO STDOUT`` on a pooled connection and hands its output over in chunks.
+
+    The COPY runs on a background thread, which blocks once
+    ``EXPORT_QUEUE_CHUNKS`` chunks are waiting, so a slow client holds at most
+    that much output in memory. Iterate the stream for the chunks, or use
+    ``reader()`` for a file object. ``close()`` cancels an unfinished COPY.
+    """
+
+    def __init__(self, query, params, chunk_size=EXPORT_CHUNK_SIZE):
+        self.query = query
+        self.params = params
+        self.chunk_size = chunk_size
+        self._queue = queue.Queue(EXPORT_QUEUE_CHUNKS)
+        self._buffer = bytearray()
+        self._conn = None
+        self._cancelled = threading.Event()
+        self._first = None
+
+    def start(self):
+        """Start the COPY and wait for its first output, raising its error if it fails before any."""
+        threading.Thread(target=self._run, name="copy-export", daemon=True).start()
+        kind, value = self._queue.get()
+        if kind == "error":
+            raise value
+        self._first = (kind, value)
+        return self
+
+    def __iter__(self):
+        item, self._first = self._first, None
+        while True:
+            kind, value = item or self._queue.get()
+            item = None
+            if kind == "error":
+                raise value
+            if kind == "done":
+                return
+            yield value
+
+    def reader(self):
+        """Return a buffered binary file reading the COPY output."""
+        return io.BufferedReader(_ChunkReader(iter(self)), self.chunk_size)
+
+    def close(self):
+        """Cancel the COPY if it is still running."""
+        self._cancelled.set()
+        conn = self._conn
+        if conn is not None:
+            conn.cancel()
+        # Unblock the producer so it can see the cancellation, and any reader still waiting
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            self._queue.put_nowait(("done", None))
+        except queue.Full:
+            pass
+
+    def write(self, data):
+        # Called by psycopg2 once per row; output of a cancelled COPY is dropped
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self._put("data", bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, kind, value):
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put((kind, value), timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _run(self):
+        try:
+            with db_connection() as conn:
+                self._conn = conn
+                try:
+                    if not self._cancelled.is_set():
+                        with conn.cursor() as cursor:
+                            cursor.copy_expert(cursor.mogrify(self.query, self.params).decode(), self)
+                finally:
+                    self._conn = None
+            if self._buffer:
+                self._put("data", bytes(self._buffer))
+            self._put("done", None)
+        except Exception as e:
+            self._put("error", e)
+
+
+class _ChunkReader(io.RawIOBase):
+    """A raw binary file over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            self._pending = next(self._chunks, b"")
+            if not self._pending:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def iter_gzip(chunks, level=EXPORT_GZIP_LEVEL):
+    """Gzip-compress a stream of byte chunks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _Sink:
+    """A write-only file collecting what the Parquet writer produces between reads."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_supported():
+    """Return whether pyarrow, which Parquet exports need, is installed."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def iter_parquet(stream, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    """Convert a CSV ``CopyStream`` into a streamed Parquet file, one row group at a time.
+
+    pyarrow parses the CSV straight into columnar record batches, so no row
+    ever becomes a Python object.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    batches = pacsv.open_csv(
+        stream.reader(),
+        read_options=pacsv.ReadOptions(column_names=schema.names),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types=schema, null_values=[""], strings_can_be_null=True, quoted_strings_can_be_null=False,
+        ),
+    )
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        pending, rows = [], 0
+        for batch in batches:
+            pending.append(batch)
+            rows += batch.num_rows
+            if rows >= row_group_size:
+                writer.write_table(pa.Table.from_batches(pending, schema), row_group_size)
+                pending, rows = [], 0
+                yield sink.take()
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema), row_group_size)
+    yield sink.take()
+
+
+def parquet_schema():
+    """Return the Arrow schema of exported vehicles."""
+    import pyarrow as pa
+
+    types = {
+        "horse_power": pa.int32(),
+        "model_year": pa.int32(),
+        "purchase_price": pa.decimal128(10, 2),
+    }
+    return pa.schema([pa.field(column, types.get(column, pa.string())) for column in VEHICLE_COLUMNS])
@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+# Milliseconds the first insert of a group waits for others to join it; 0 commits every insert on its own
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", 0))
+# Most inserts combined into one group; a full group is committed without waiting out the window
+GROUP_COMMIT_MAX_SIZE = int(os.getenv("GROUP_COMMIT_MAX_SIZE", 100))
+
+
+class _Pending:
+    """One request's item waiting for its group to be written."""
+
+    __slots__ = ("item", "event", "result", "error")
+
+    def __init__(self, item):
+        self.item = item
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GroupCommitter:
+    """Combines items submitted concurrently by a worker's threads into one write.
+
+    The first submitter of a group is its leader: it waits up to ``window``
+    seconds, or until ``max_size`` items have joined, then calls
+    ``write_group(items)`` with them and hands each submitter its own entry of
+    the returned list. Items arriving while a group is being written start the
+    next group. If ``write_group`` raises, every submitter of the group does.
+    """
+
+    def __init__(self, write_group, window, max_size):
+        self.write_group = write_group
+        self.window = window
+        self.max_size = max_size
+        self._cond = threading.Condition()
+        self._group = None
+        self._groups = 0
+        self._items = 0
+
+    def submit(self, item):
+        """Add ``item`` to the open group and return its result once the group is written."""
+        pending = _Pending(item)
+        with self._cond:
+            group = self._group
+            leader = group is None
+            if leader:
+                group = self._group = []
+            group.append(pending)
+            if len(group) >= self.max_size:
+                self._group = None
+                self._cond.notify_all()
+        if leader:
+            self._lead(group)
+        else:
+            pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stats(self):
+        """Return how many groups were written and how many items they held."""
+        with self._cond:
+            return {"groups": self._groups, "items": self._items}
+
+    def _lead(self, group):
+        deadline = time.monotonic() + self.window
+        with self._cond:
+            while self._group is group:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._group = None
+                    break
+                self._cond.wait(remaining)
+            self._groups += 1
+            self._items += len(group)
+        try:
+            results = self.write_group([pending.item for pending in group])
+        except BaseException as e:
+            for pending in group:
+                pending.error = e
+        else:
+            for pending, result in zip(group, results):
+                pending.result = result
+        for pending in group:
+            pending.event.set()
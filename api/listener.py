@@ -0,0 +1,98 @@
+import os
+import select
+import threading
+import time
+
+from psycopg2 import connect, Error
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+
+class PgListener(threading.Thread):
+    """Background thread that LISTENs on PostgreSQL channels from one connection.
+
+    Each channel has a notification callback and an optional ``on_connect``
+    callback. ``on_connect`` runs every time the listening connection is
+    (re)established, because notifications sent while it was down are lost.
+    """
+
+    def __init__(self, connect_kwargs, reconnect_delay=1.0, poll_interval=5.0):
+        super().__init__(name="pg-listener", daemon=True)
+        self.connect_kwargs = connect_kwargs
+        self.reconnect_delay = reconnect_delay
+        self.poll_interval = poll_interval
+        self.pid = os.getpid()
+        self.connected = threading.Event()
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback, on_connect=None):
+        """Register callbacks for ``channel``; takes effect on the next (re)connect."""
+        with self._lock:
+            self._channels.setdefault(channel, []).append((callback, on_connect))
+
+    def run(self):
+        while True:
+            conn = None
+            try:
+                conn = connect(**self.connect_kwargs)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with self._lock:
+                    channels = {name: list(subscribers) for name, subscribers in self._channels.items()}
+                with conn.cursor() as cursor:
+                    for channel in channels:
+                        cursor.execute(f'LISTEN "{channel}";')
+                self.connected.set()
+                for subscribers in channels.values():
+                    for _, on_connect in subscribers:
+                        if on_connect is not None:
+                            on_connect()
+                self._listen(conn, channels)
+            except Error as e:
+                print(f"Notification listener lost its database connection: {e}")
+            finally:
+                self.connected.clear()
+                if conn is not None and not conn.closed:
+                    conn.close()
+            time.sleep(self.reconnect_delay)
+
+    def _listen(self, conn, channels):
+        while True:
+            select.select([conn], [], [], self.poll_interval)
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                for callback, _ in channels.get(notify.channel, ()):
+                    try:
+                        callback(notify.payload)
+                    except Exception as e:
+                        print(f"Error handling notification on '{notify.channel}': {e}")
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener(connect_kwargs, subscriptions):
+    """Start this process's listener thread on first use or after a fork.
+
+    ``subscriptions`` is a list of ``(channel, callback, on_connect)`` tuples
+    registered before the thread starts.
+    """
+    global _listener
+    listener = _listener
+    if listener is not None and listener.pid == os.getpid():
+        return listener
+    with _listener_lock:
+        if _listener is None or _listener.pid != os.getpid():
+            listener = PgListener(connect_kwargs)
+            for channel, callback, on_connect in subscriptions:
+                listener.subscribe(channel, callback, on_connect)
+            listener.start()
+            _listener = listener
+        return _listener
+
+
+def listening():
+    """Return whether this process's listener is connected, so no notification can be missed."""
+    listener = _listener
+    return listener is not None and listener.pid == os.getpid() and listener.connected.is_set()
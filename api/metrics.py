@@ -0,0 +1,323 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.sql import Composable
+from werkzeug.wsgi import ClosingIterator
+
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Metric name -> (type, help, label names, histogram buckets)
+METRICS = {
+    "http_requests_total": (
+        "counter", "Requests served, by route and status code.", ("method", "route", "status"), None,
+    ),
+    "http_request_duration_seconds": (
+        "histogram", "Time from receiving a request to sending the last byte of its response.",
+        ("method", "route"), REQUEST_BUCKETS,
+    ),
+    "http_request_phase_seconds": (
+        "histogram", "Time each request spent per phase: acquire, query, serialize, encode and other.",
+        ("route", "phase"), PHASE_BUCKETS,
+    ),
+}
+
+# Requests slower than this many milliseconds are logged with their SQL; 0 disables the log. Set from
+# the app's SLOW_REQUEST_MS setting by instrument_app, once create_app has loaded .env
+_slow_request_ms = 0.0
+# Statements kept per request for the slow-request log
+MAX_LOGGED_STATEMENTS = 20
+# Seconds between writes of this process's metrics to METRICS_DIR
+FLUSH_INTERVAL = 1.0
+
+
+class Registry:
+    """Counters and histograms for one process, keyed by metric name and label values."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+        self.changed = False
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self.changed = True
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][3]
+        with self._lock:
+            key = (name, labels)
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            series[bisect_left(buckets, value)] += 1
+            series[-1] += value
+            self.changed = True
+
+    def snapshot(self):
+        """Return the current values as JSON-serializable data."""
+        with self._lock:
+            self.changed = False
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), list(series)] for (name, labels), series in self._histograms.items()],
+            }
+
+
+registry = Registry()
+
+
+class RequestTimer:
+    """Wall-clock time of one request, split into exclusive phases.
+
+    Exactly one phase is current at any moment; time outside any named phase
+    is charged to ``other``, so the phases add up to the request's duration.
+    """
+
+    __slots__ = ("start", "mark", "current", "phases", "statements")
+
+    def __init__(self):
+        self.start = self.mark = time.perf_counter()
+        self.current = "other"
+        self.phases = {}
+        self.statements = []
+
+    def switch(self, name):
+        """Make ``name`` the current phase, returning the time spent in the one it replaces."""
+        now = time.perf_counter()
+        elapsed = now - self.mark
+        self.phases[self.current] = self.phases.get(self.current, 0.0) + elapsed
+        self.mark = now
+        self.current = name
+        return elapsed
+
+    def statement(self, query, elapsed, cursor):
+        """Remember a statement for the slow-request log."""
+        if _slow_request_ms and len(self.statements) < MAX_LOGGED_STATEMENTS:
+            if isinstance(query, Composable):
+                query = query.as_string(cursor)
+            elif isinstance(query, bytes):
+                query = query.decode(errors="replace")
+            self.statements.append((" ".join(query.split()), elapsed))
+
+
+_timer = ContextVar("request_timer", default=None)
+
+
+def current_timer():
+    """Return the timer of the request being served in this context, if any."""
+    return _timer.get()
+
+
+@contextmanager
+def phase(name):
+    """Charge the time spent inside the block to phase ``name`` of the current request."""
+    timer = _timer.get()
+    if timer is None:
+        yield
+        return
+    previous = timer.current
+    timer.switch(name)
+    try:
+        yield
+    finally:
+        timer.switch(previous)
+
+
+def timed_iter(iterable, name):
+    """Charge the time spent producing each item of ``iterable`` to phase ``name``."""
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def begin_request():
+    """Start timing a request in the current context."""
+    timer = RequestTimer()
+    _timer.set(timer)
+    return timer
+
+
+def end_request(timer, method, route, status, path=None):
+    """Record a finished request and log it if it was slow."""
+    timer.switch(None)
+    _timer.set(None)
+    duration = timer.mark - timer.start
+    route = route or "unmatched"
+    registry.inc("http_requests_total", (method, route, str(status)))
+    registry.observe("http_request_duration_seconds", (method, route), duration)
+    for name, seconds in timer.phases.items():
+        registry.observe("http_request_phase_seconds", (route, name), seconds)
+    _start_flusher()
+
+    if _slow_request_ms and duration * 1000 >= _slow_request_ms:
+        phases = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in sorted(timer.phases.items()))
+        print(f"Slow request: {method} {path or route} {status} {duration * 1000:.1f}ms {phases}")
+        for query, seconds in timer.statements:
+            print(f"  {seconds * 1000:.1f}ms {query}")
+
+
+class RequestMetrics:
+    """WSGI middleware timing each request until its response has been fully sent."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        timer = begin_request()
+        status = []
+
+        def timed_start_response(status_line, headers, exc_info=None):
+            status[:] = [status_line.split(" ", 1)[0]]
+            return start_response(status_line, headers, exc_info)
+
+        def finish():
+            end_request(timer, environ["REQUEST_METHOD"], environ.get("metrics.route"),
+                        status[0] if status else "500", environ.get("PATH_INFO"))
+
+        try:
+            response = self.wsgi_app(environ, timed_start_response)
+        except BaseException:
+            finish()
+            raise
+        return ClosingIterator(response, finish)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, charging serialization to the ``encode`` phase."""
+
+    def dumps(self, obj, **kwargs):
+        with phase("encode"):
+            return super().dumps(obj, **kwargs)
+
+
+def _record_route():
+    request.environ["metrics.route"] = request.url_rule.rule if request.url_rule else None
+
+
+def instrument_app(app):
+    """Time every request ``app`` serves, labelled by its URL rule, and apply its ``SLOW_REQUEST_MS``."""
+    global _slow_request_ms
+    _slow_request_ms = float(app.config.get("SLOW_REQUEST_MS") or 0)
+    app.json = TimedJSONProvider(app)
+    app.before_request_funcs.setdefault(None, []).insert(0, _record_route)
+    app.wsgi_app = RequestMetrics(app.wsgi_app)
+
+
+_flusher_pid = None
+
+
+def _metrics_path(directory, pid):
+    return os.path.join(directory, f"metrics-{pid}.json")
+
+
+def flush():
+    """Write this process's metrics to METRICS_DIR for its sibling workers to aggregate."""
+    directory = os.getenv("METRICS_DIR")
+    if not directory:
+        return
+    path = _metrics_path(directory, os.getpid())
+    with open(path + ".tmp", "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(path + ".tmp", path)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if registry.changed:
+            try:
+                flush()
+            except OSError as e:
+                print(f"Error writing metrics: {e}")
+
+
+def _start_flusher():
+    """Start this process's flush thread on first use or after a fork."""
+    global _flusher_pid
+    if _flusher_pid == os.getpid() or not os.getenv("METRICS_DIR"):
+        return
+    _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name="metrics-flusher", daemon=True).start()
+    atexit.register(flush)
+
+
+def clear_metrics_dir(directory):
+    """Remove snapshots left by earlier runs, so counters start from zero with the server."""
+    for name in os.listdir(directory):
+        if name.startswith("metrics-"):
+            os.remove(os.path.join(directory, name))
+
+
+def _snapshots():
+    yield registry.snapshot()
+    directory = os.getenv("METRICS_DIR")
+    if not directory:
+        return
+    own = os.path.basename(_metrics_path(directory, os.getpid()))
+    for name in os.listdir(directory):
+        if name.startswith("metrics-") and name.endswith(".json") and name != own:
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue  # a worker replacing its file, or one that just exited
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render_metrics():
+    """Render every worker's metrics, summed, in the Prometheus text format."""
+    counters = {}
+    histograms = {}
+    for snapshot in _snapshots():
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, series in snapshot["histograms"]:
+            key = (name, tuple(labels))
+            total = histograms.get(key)
+            histograms[key] = series if total is None else [a + b for a, b in zip(total, series)]
+
+    lines = []
+    for name, (metric_type, help_text, label_names, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == "counter":
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {value}")
+            continue
+        for (series_name, labels), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(label_names, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_names, labels)} {series[-1]}")
+            lines.append(f"{name}_count{_format_labels(label_names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
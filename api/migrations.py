@@ -0,0 +1,161 @@
+import argparse
+import sys
+
+from psycopg2 import Error
+
+from api.changes import CHANGE_LOG_QUERY
+from api.models import NEXT_ROW_VERSION
+from api.snapshot import TABLE_VERSION_QUERY
+from api.stats import STATS_TABLES_QUERY, rebuild_stats
+
+LEDGER_QUERY = """
+CREATE TABLE IF NOT EXISTS vehicles_schema.schema_migrations (
+    version INT PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+# Key of the advisory lock held while migrating, so concurrent releases apply each migration once
+MIGRATION_LOCK_ID = 0x76656869
+
+
+def _create_vehicles(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS vehicles_schema.vehicles (
+        vin VARCHAR(17) PRIMARY KEY,
+        manufacturer_name VARCHAR(255) NOT NULL,
+        description TEXT,
+        horse_power INT,
+        model_name VARCHAR(255) NOT NULL,
+        model_year INT NOT NULL,
+        purchase_price DECIMAL(10, 2),
+        fuel_type VARCHAR(50) NOT NULL
+    );
+    """)
+
+
+def _create_listing_indexes(cursor):
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS vehicles_manufacturer_name_idx ON vehicles_schema.vehicles (manufacturer_name, vin);
+    CREATE INDEX IF NOT EXISTS vehicles_model_name_idx ON vehicles_schema.vehicles (model_name, vin);
+    CREATE INDEX IF NOT EXISTS vehicles_fuel_type_idx ON vehicles_schema.vehicles (fuel_type, vin);
+    CREATE INDEX IF NOT EXISTS vehicles_model_year_idx ON vehicles_schema.vehicles (model_year, vin);
+    CREATE INDEX IF NOT EXISTS vehicles_purchase_price_idx ON vehicles_schema.vehicles (purchase_price);
+    CREATE INDEX IF NOT EXISTS vehicles_manufacturer_name_model_year_idx ON vehicles_schema.vehicles (manufacturer_name, model_year);
+    """)
+
+
+def _create_stats_tables(cursor):
+    cursor.execute("SELECT to_regclass('vehicles_schema.vehicle_year_stats');")
+    stats_exist = cursor.fetchone()[0] is not None
+    cursor.execute(STATS_TABLES_QUERY)
+    if not stats_exist:
+        rebuild_stats(cursor)
+
+
+def _add_row_versions(cursor):
+    cursor.execute("CREATE SEQUENCE IF NOT EXISTS vehicles_schema.vehicles_row_version_seq;")
+    cursor.execute(
+        "ALTER TABLE vehicles_schema.vehicles ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT "
+        + NEXT_ROW_VERSION + ";"
+    )
+
+
+def _create_change_log(cursor):
+    cursor.execute(CHANGE_LOG_QUERY)
+
+
+def _add_table_version(cursor):
+    cursor.execute(TABLE_VERSION_QUERY)
+
+
+# (version, description, apply) in order. Append new migrations; never edit or
+# renumber one that has shipped. Each is idempotent, so databases created before
+# the ledger existed are adopted by replaying them.
+MIGRATIONS = [
+    (1, "Create the vehicles table", _create_vehicles),
+    (2, "Index the listing filters and keyset sort orders", _create_listing_indexes),
+    (3, "Add the fleet statistics summary tables", _create_stats_tables),
+    (4, "Add row versions for ETags", _add_row_versions),
+    (5, "Log vehicle changes for the change feed", _create_change_log),
+    (6, "Version the vehicles table for collection snapshots", _add_table_version),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(cursor):
+    """Return the newest migration applied to the database, or 0 for a new database."""
+    cursor.execute("SELECT to_regclass('vehicles_schema.schema_migrations');")
+    if cursor.fetchone()[0] is None:
+        return 0
+    cursor.execute("SELECT coalesce(max(version), 0) FROM vehicles_schema.schema_migrations;")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations and return the versions applied.
+
+    An up-to-date database costs one version check. Otherwise each migration
+    commits together with its ledger row, under an advisory lock that makes
+    concurrent callers wait and then find the work done.
+    """
+    with conn.cursor() as cursor:
+        current = schema_version(cursor)
+        conn.rollback()
+        if current >= SCHEMA_VERSION:
+            return []
+
+        cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+        applied = []
+        try:
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS vehicles_schema;")
+            cursor.execute(LEDGER_QUERY)
+            conn.commit()
+            current = schema_version(cursor)
+            for version, description, apply in MIGRATIONS:
+                if version <= current:
+                    continue
+                apply(cursor)
+                cursor.execute(
+                    "INSERT INTO vehicles_schema.schema_migrations (version, description) VALUES (%s, %s);",
+                    (version, description),
+                )
+                conn.commit()
+                applied.append(version)
+                print(f"Applied migration {version}: {description}")
+        except Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied
+
+
+def main(argv=None):
+    """Apply pending schema migrations, or check whether any are pending."""
+    parser = argparse.ArgumentParser(prog="python -m api.migrations", description=main.__doc__)
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if migrations are pending")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from api.db import get_db_connection
+
+    load_dotenv()
+    conn = get_db_connection()
+    try:
+        if args.check:
+            with conn.cursor() as cursor:
+                current = schema_version(cursor)
+            print(f"Schema version {current} of {SCHEMA_VERSION}.")
+            return 1 if current < SCHEMA_VERSION else 0
+        applied = migrate(conn)
+    finally:
+        conn.close()
+
+    print(f"Applied {len(applied)} migration(s); schema is at version {SCHEMA_VERSION}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+VEHICLE_COLUMNS = (
+    "vin", "manufacturer_name", "description", "horse_power",
+    "model_name", "model_year", "purchase_price", "fuel_type",
+)
+SELECT_VEHICLES = "SELECT " + ", ".join(VEHICLE_COLUMNS) + " FROM vehicles_schema.vehicles"
+# A vehicle and its row version, the value behind its ETag
+SELECT_VEHICLE_VERSION = "SELECT " + ", ".join(VEHICLE_COLUMNS) + ", row_version FROM vehicles_schema.vehicles WHERE vin = %s;"
+# Every vehicle whose VIN is in an array parameter
+SELECT_VEHICLES_BY_VIN = SELECT_VEHICLES + " WHERE vin = ANY(%s);"
+# Row versions come from one sequence, so a recreated vehicle never reuses an old ETag
+NEXT_ROW_VERSION = "nextval('vehicles_schema.vehicles_row_version_seq')"
+
+REQUIRED_FIELDS = ["vin", "manufacturer_name", "model_name", "model_year", "fuel_type"]
+UPDATABLE_FIELDS = ["manufacturer_name", "description", "horse_power", "model_name", "model_year", "purchase_price", "fuel_type"]
+
+# Limits enforced by the vehicles table's column types
+MAX_LENGTHS = {"vin": 17, "manufacturer_name": 255, "model_name": 255, "fuel_type": 50}
+TEXT_FIELDS = ["vin", "manufacturer_name", "description", "model_name", "fuel_type"]
+INTEGER_FIELDS = ["horse_power", "model_year"]
+MAX_INTEGER = 2 ** 31 - 1  # INT
+MAX_PRICE = 10 ** 8  # DECIMAL(10, 2)
+
+
+def validate_new_vehicle(data):
+    """Return a dict of field errors for a vehicle about to be created."""
+    errors = {}
+
+    # Validate required fields
+    for field in REQUIRED_FIELDS:
+        if field not in data or data[field] in [None, '']:
+            errors[field] = f"'{field}' is required."
+
+    # Validate data types
+    if "model_year" in data and not isinstance(data["model_year"], int):
+        errors["model_year"] = "'model_year' must be an integer."
+    if "horse_power" in data and data["horse_power"] is not None and not isinstance(data["horse_power"], int):
+        errors["horse_power"] = "'horse_power' must be an integer."
+    if "purchase_price" in data and data["purchase_price"] is not None and not isinstance(data["purchase_price"], (int, float)):
+        errors["purchase_price"] = "'purchase_price' must be a number."
+
+    return errors
+
+
+def validate_vehicle_update(data):
+    """Return a dict of field errors for the fields a partial update changes."""
+    errors = {}
+
+    # Required fields may be left out, but not cleared
+    for field in REQUIRED_FIELDS:
+        if field in data and data[field] in [None, '']:
+            errors[field] = f"'{field}' is required."
+
+    # Validate data types
+    if "model_year" in data and data["model_year"] is not None and not isinstance(data["model_year"], int):
+        errors["model_year"] = "'model_year' must be an integer."
+    if "horse_power" in data and data["horse_power"] is not None and not isinstance(data["horse_power"], int):
+        errors["horse_power"] = "'horse_power' must be an integer."
+    if "purchase_price" in data and data["purchase_price"] is not None and not isinstance(data["purchase_price"], (int, float)):
+        errors["purchase_price"] = "'purchase_price' must be a number."
+
+    return validate_column_limits(data, errors)
+
+
+def validate_column_limits(data, errors):
+    """Add errors for values the vehicles table itself would reject.
+
+    Used where one bad value would otherwise abort a whole multi-row statement.
+    """
+    for field in TEXT_FIELDS:
+        value = data.get(field)
+        if field in errors or value is None:
+            continue
+        if not isinstance(value, str):
+            errors[field] = f"'{field}' must be a string."
+        elif field in MAX_LENGTHS and len(value) > MAX_LENGTHS[field]:
+            errors[field] = f"'{field}' must be at most {MAX_LENGTHS[field]} characters."
+    for field in INTEGER_FIELDS:
+        value = data.get(field)
+        if field in errors or value is None:
+            continue
+        if isinstance(value, bool) or abs(value) > MAX_INTEGER:
+            errors[field] = f"'{field}' must be an integer."
+    price = data.get("purchase_price")
+    if "purchase_price" not in errors and price is not None:
+        if isinstance(price, bool) or not abs(price) < MAX_PRICE:
+            errors["purchase_price"] = f"'purchase_price' must be a number below {MAX_PRICE}."
+    return errors
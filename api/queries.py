@@ -0,0 +1,149 @@
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from psycopg2 import sql
+
+from api.models import NEXT_ROW_VERSION, VEHICLE_COLUMNS
+from api.stats import STATS_COLUMNS
+
+# Query parameters matched exactly against a column
+EQUALITY_FILTERS = ["manufacturer_name", "model_name", "fuel_type"]
+# Query parameter -> (column, comparison, parser, type name)
+RANGE_FILTERS = {
+    "model_year_min": ("model_year", ">=", int, "an integer"),
+    "model_year_max": ("model_year", "<=", int, "an integer"),
+    "purchase_price_min": ("purchase_price", ">=", Decimal, "a number"),
+    "purchase_price_max": ("purchase_price", "<=", Decimal, "a number"),
+}
+# Columns GET /vehicle may be sorted by ("-column" sorts descending). Only NOT
+# NULL columns are allowed so that (column, vin) keyset comparisons are exact.
+SORT_COLUMNS = ["vin", "manufacturer_name", "model_name", "model_year", "fuel_type"]
+
+
+def parse_vehicle_filters(args):
+    """Parse listing filters from query parameters, returning ``(filters, errors)``."""
+    filters = {}
+    errors = {}
+    for name in EQUALITY_FILTERS:
+        if name in args:
+            filters[name] = args[name]
+    for name, (_, _, parse, type_name) in RANGE_FILTERS.items():
+        if name not in args:
+            continue
+        try:
+            value = parse(args[name])
+            if isinstance(value, Decimal) and not value.is_finite():
+                raise ValueError(args[name])
+            filters[name] = value
+        except (ValueError, InvalidOperation):
+            errors[name] = f"'{name}' must be {type_name}."
+    return filters, errors
+
+
+def parse_sort(value):
+    """Return ``(column, descending)`` for a sort parameter, or None if not allowed."""
+    value = value or "vin"
+    descending = value.startswith("-")
+    column = value[1:] if descending else value
+    if column not in SORT_COLUMNS:
+        return None
+    return column, descending
+
+
+def encode_cursor(row, column):
+    """Build the ``after`` value that resumes a listing after ``row``."""
+    vin = row[VEHICLE_COLUMNS.index("vin")]
+    if column == "vin":
+        return vin
+    position = json.dumps([row[VEHICLE_COLUMNS.index(column)], vin])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_cursor(after, column):
+    """Return the keyset position encoded in ``after``, or None if it is malformed."""
+    if column == "vin":
+        return [after]
+    try:
+        padded = after + "=" * (-len(after) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        return None
+    if not isinstance(position, list) or len(position) != 2 or not isinstance(position[1], str):
+        return None
+    value_type = int if column == "model_year" else str
+    if not isinstance(position[0], value_type) or isinstance(position[0], bool):
+        return None
+    return position
+
+
+def build_vehicle_query(filters, sort=("vin", False), after=None, limit=None):
+    """Compose a filtered, keyset-ordered SELECT over the vehicles table.
+
+    ``after`` is a decoded keyset position from ``decode_cursor``. Returns
+    ``(query, params)`` ready for ``cursor.execute``.
+    """
+    conditions = []
+    params = []
+    for name in EQUALITY_FILTERS:
+        if name in filters:
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(name)))
+            params.append(filters[name])
+    for name, (column, comparison, _, _) in RANGE_FILTERS.items():
+        if name in filters:
+            conditions.append(sql.SQL("{} " + comparison + " %s").format(sql.Identifier(column)))
+            params.append(filters[name])
+
+    column, descending = sort
+    comparison = sql.SQL("<" if descending else ">")
+    direction = sql.SQL(" DESC" if descending else "")
+    if column == "vin":
+        keys = sql.Identifier("vin")
+        order = sql.SQL("vin{}").format(direction)
+    else:
+        keys = sql.SQL("({}, vin)").format(sql.Identifier(column))
+        order = sql.SQL("{column}{direction}, vin{direction}").format(
+            column=sql.Identifier(column), direction=direction
+        )
+    if after is not None:
+        placeholders = sql.SQL("%s") if column == "vin" else sql.SQL("(%s, %s)")
+        conditions.append(sql.SQL("{} {} {}").format(keys, comparison, placeholders))
+        params.extend(after)
+
+    query = sql.SQL("SELECT {columns} FROM vehicles_schema.vehicles").format(
+        columns=sql.SQL(", ").join(map(sql.Identifier, VEHICLE_COLUMNS))
+    )
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    query += sql.SQL(" ORDER BY ") + order
+    if limit is not None:
+        query += sql.SQL(" LIMIT %s")
+        params.append(limit)
+    return query, params
+
+
+def build_update_query(fields, versions=None):
+    """Compose the single statement behind PUT and PATCH /vehicle/<vin>.
+
+    It locks the row, sets ``fields`` and a new row version, and returns the
+    updated vehicle, its new version and its ``STATS_COLUMNS`` from before the
+    change. With ``versions`` (parsed from If-Match) the row is only updated if
+    its current version is one of them. Parameters are the field values, the
+    VIN, then ``versions``.
+    """
+    precondition = sql.SQL(" AND v.row_version = ANY(%s)") if versions is not None else sql.SQL("")
+    return sql.SQL("""
+        UPDATE vehicles_schema.vehicles v
+        SET ({fields}) = ROW({placeholders}), row_version = {next_version}
+        FROM (SELECT vin, {stats} FROM vehicles_schema.vehicles WHERE vin = %s FOR UPDATE) old
+        WHERE v.vin = old.vin{precondition}
+        RETURNING {vehicle}, v.row_version, {old_stats};
+    """).format(
+        fields=sql.SQL(", ").join(map(sql.Identifier, fields)),
+        placeholders=sql.SQL(", ").join(sql.Placeholder() * len(fields)),
+        next_version=sql.SQL(NEXT_ROW_VERSION),
+        stats=sql.SQL(", ").join(map(sql.Identifier, STATS_COLUMNS)),
+        precondition=precondition,
+        vehicle=sql.SQL(", ").join(sql.Identifier("v", column) for column in VEHICLE_COLUMNS),
+        old_stats=sql.SQL(", ").join(sql.Identifier("old", column) for column in STATS_COLUMNS),
+    )
@@ -1,115 +1,337 @@
-from flask import Flask, request, jsonify
-from psycopg2 import connect, sql, Error
+from flask import Blueprint, Response, request, jsonify, url_for
+from psycopg2 import Error
+from psycopg2.extras import execute_values
+import json
 import os
-from urllib.parse import urlparse
-from dotenv import load_dotenv
-
-# Load environment variables from .env (for local development)
-load_dotenv()
-
-app = Flask(__name__)
-
-# Database connection configuration
-DATABASE_URL = os.getenv("DATABASE_URL")
-if DATABASE_URL:
-    # Parse DATABASE_URL
-    parsed_url = urlparse(DATABASE_URL)
-    DB_CONFIG = {
-        "dbname": parsed_url.path[1:],  # Remove leading '/'
-        "user": parsed_url.username,
-        "password": parsed_url.password,
-        "host": parsed_url.hostname,
-        "port": parsed_url.port,
-    }
-else:
-    # Handle case when DATABASE_URL is not set
-    raise Exception("DATABASE_URL environment variable not set")
-
-def get_db_connection():
-    """Establish a database connection."""
-    try:
-        # Determine SSL mode based on the environment
-        sslmode = "require" if os.getenv("ENV") == "production" else "disable"
-        return connect(sslmode=sslmode, **DB_CONFIG)
-    except Error as e:
-        print(f"Error connecting to the database: {e}")
-        raise
 
-def initialize_database():
-    """Initialize the database schema."""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Create the schema without specifying AUTHORIZATION
-        cursor.execute("CREATE SCHEMA IF NOT EXISTS vehicles_schema;")
-
-        # Create the vehicles table within the schema
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS vehicles_schema.vehicles (
-            vin VARCHAR(17) PRIMARY KEY,
-            manufacturer_name VARCHAR(255) NOT NULL,
-            description TEXT,
-            horse_power INT,
-            model_name VARCHAR(255) NOT NULL,
-            model_year INT NOT NULL,
-            purchase_price DECIMAL(10, 2),
-            fuel_type VARCHAR(50) NOT NULL
-        );
-        """
-        cursor.execute(create_table_query)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print("Database initialized successfully.")
-    except Error as e:
-        print(f"Error initializing database: {e}")
-        raise
-
-@app.errorhandler(400)
+from api.bulk import CONFLICT_POLICIES, BulkLoader
+from api.cache import (
+    INVALIDATE_ALL, INVALIDATION_CHANNEL, handle_invalidation, publish_invalidation, publish_invalidations, vin_cache,
+)
+from api.changes import CHANGES_CHANNEL, change_feed, iter_stream, open_stream
+from api.db import PoolTimeout, configured, connect_kwargs, db_connection, get_pool
+from api.export import EXPORT_FORMATS, CopyStream, build_copy_query, iter_gzip, iter_parquet, parquet_supported
+from api.group_commit import GROUP_COMMIT_MAX_SIZE, GROUP_COMMIT_WINDOW_MS, GroupCommitter
+from api.listener import start_listener
+from api.metrics import phase, render_metrics, timed_iter
+from api.models import (
+    SELECT_VEHICLE_VERSION, SELECT_VEHICLES_BY_VIN, UPDATABLE_FIELDS, VEHICLE_COLUMNS,
+    validate_column_limits, validate_new_vehicle, validate_vehicle_update,
+)
+from api.queries import (
+    SORT_COLUMNS, build_update_query, build_vehicle_query, decode_cursor, encode_cursor, parse_sort, parse_vehicle_filters,
+)
+from api.serializers import vehicle_layout
+from api.snapshot import collection_etag, collection_snapshots
+from api.stats import RETURNING_STATS, STATS_COLUMNS, StatsDelta, read_stats
+
+bp = Blueprint("api", __name__)
+
+# Keyset pagination limits for GET /vehicle
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Rows fetched per round trip by the server-side cursor behind streamed listings
+STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", 2000))
+# Rows buffered per COPY into the staging table by POST /vehicle/bulk
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 5000))
+# VINs bound to each '= ANY(%s)' statement by the batch lookup and delete endpoints
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 10000))
+# Most VINs accepted by one batch lookup or delete request
+MAX_BATCH_VINS = 100000
+# Seconds a change stream served by the Flask app stays open before the client reconnects; it holds a
+# worker thread throughout, and gunicorn's sync workers are killed after 30 seconds on one request
+CHANGE_STREAM_MAX_SECONDS = float(os.getenv("CHANGE_STREAM_MAX_SECONDS", 25))
+
+@bp.app_errorhandler(400)
 def bad_request(e):
     return jsonify({"error": "Bad Request", "message": str(e)}), 400
 
-@app.errorhandler(422)
+@bp.app_errorhandler(422)
 def unprocessable_entity(e):
     return jsonify({"error": "Unprocessable Entity", "message": str(e)}), 422
 
-@app.route('/', methods=['GET'])
+@bp.app_errorhandler(PoolTimeout)
+def pool_timeout(e):
+    return jsonify({"error": "Service Unavailable", "message": str(e)}), 503
+
+@bp.before_app_request
+def start_notification_listener():
+    """Subscribe this worker to vehicle changes and to cache invalidations published by its siblings."""
+    if not configured():
+        return
+    subscriptions = [
+        (CHANGES_CHANNEL, change_feed.wake, change_feed.wake),
+        (CHANGES_CHANNEL, collection_snapshots.invalidate, collection_snapshots.invalidate),
+    ]
+    if INVALIDATION_CHANNEL:
+        subscriptions.append((INVALIDATION_CHANNEL, handle_invalidation, vin_cache.clear))
+    start_listener(connect_kwargs(), subscriptions)
+
+@bp.route('/', methods=['GET'])
 def home():
     """Home route to verify the API is running."""
     return jsonify({"message": "Welcome to the Vehicles API"}), 200
 
-@app.route('/vehicle', methods=['GET'])
+@bp.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Report this worker's database connection pool usage."""
+    return jsonify(get_pool().stats()), 200
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose request metrics from every worker in the Prometheus text format."""
+    return Response(render_metrics(), status=200, mimetype="text/plain; version=0.0.4")
+
+@bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Report this worker's VIN cache counters."""
+    return jsonify(vin_cache.stats()), 200
+
+def _stream_vehicle_rows(query, params):
+    """Yield every row matched by ``query`` through a server-side cursor.
+
+    The first value yielded is ``None`` once the query is running, so callers can
+    surface connection and SQL errors before the response starts streaming.
+    """
+    with db_connection() as conn:
+        with conn.cursor(name="vehicles_stream") as cursor:
+            cursor.itersize = STREAM_ITERSIZE
+            cursor.execute(query, params)
+            yield None
+            for row in cursor:
+                yield row
+
+def _collection_snapshot_response(response_format):
+    """Answer an unfiltered listing from this worker's snapshot, or return None to stream it instead.
+
+    Snapshots are tagged with the table version, so a matching If-None-Match is
+    answered with 304 before any snapshot is built, and without touching the
+    database while no write has been announced since the version was checked.
+    """
+    gzipped = request.accept_encodings["gzip"] > 0
+    version = collection_snapshots.current_version()
+    etag = collection_etag(version, response_format, gzipped)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        with phase("serialize"):
+            snapshot = collection_snapshots.get(response_format, version)
+        if snapshot.body is None:
+            return None
+        etag = collection_etag(snapshot.version, response_format, gzipped)
+        mimetype = "application/x-ndjson" if response_format == "ndjson" else "application/json"
+        response = Response(snapshot.gzip_body if gzipped else snapshot.body, status=200, mimetype=mimetype)
+        if gzipped:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    return response
+
+@bp.route('/vehicle', methods=['GET'])
 def get_vehicles():
-    """Fetch all vehicle records."""
+    """Fetch vehicle records, filtered and sorted, one keyset page at a time or streamed."""
+    response_format = request.args.get("format")
+    if response_format is None:
+        best = request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"])
+        response_format = "ndjson" if best == "application/x-ndjson" else "json"
+    if response_format not in ("json", "ndjson"):
+        return jsonify({"error": "Bad Request", "message": "'format' must be 'json' or 'ndjson'."}), 400
+
+    filters, errors = parse_vehicle_filters(request.args)
+    sort = parse_sort(request.args.get("sort"))
+    if sort is None:
+        errors["sort"] = "'sort' must be one of " + ", ".join(f"'{column}'" for column in SORT_COLUMNS) + ", optionally prefixed with '-'."
+    if errors:
+        return jsonify({"error": "Bad Request", "message": "Invalid query parameters", "details": errors}), 400
+
+    limit = request.args.get("limit")
+    after = request.args.get("after")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM vehicles_schema.vehicles;")
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        vehicles = [
-            {
-                "vin": row[0],
-                "manufacturer_name": row[1],
-                "description": row[2],
-                "horse_power": row[3],
-                "model_name": row[4],
-                "model_year": row[5],
-                "purchase_price": float(row[6]) if row[6] else None,
-                "fuel_type": row[7],
-            }
-            for row in rows
-        ]
-        return jsonify(vehicles), 200
-    except Exception as e:
+        if limit is None and after is None:
+            if not filters and sort == ("vin", False):
+                response = _collection_snapshot_response(response_format)
+                if response is not None:
+                    return response
+            rows = _stream_vehicle_rows(*build_vehicle_query(filters, sort))
+            next(rows)
+            if response_format == "ndjson":
+                return Response(timed_iter(vehicle_layout.iter_ndjson(rows, STREAM_ITERSIZE), "serialize"), status=200, mimetype="application/x-ndjson")
+            return Response(timed_iter(vehicle_layout.iter_json_array(rows, STREAM_ITERSIZE), "serialize"), status=200, mimetype="application/json")
+
+        try:
+            limit = int(limit) if limit is not None else DEFAULT_PAGE_SIZE
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": "Bad Request", "message": f"'limit' must be an integer between 1 and {MAX_PAGE_SIZE}."}), 400
+
+        position = decode_cursor(after, sort[0]) if after is not None else None
+        if after is not None and position is None:
+            return jsonify({"error": "Bad Request", "message": "'after' is not a valid cursor."}), 400
+
+        query, params = build_vehicle_query(filters, sort, position, limit + 1)
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if response_format == "ndjson":
+            with phase("serialize"):
+                body = b"".join(vehicle_layout.iter_ndjson(rows, limit))
+            response = Response(body, mimetype="application/x-ndjson")
+        else:
+            with phase("serialize"):
+                body = vehicle_layout.encode_array(rows)
+            response = Response(body, mimetype="application/json")
+        if has_more:
+            args = request.args.to_dict()
+            args.update(limit=limit, after=encode_cursor(rows[-1], sort[0]))
+            response.headers["Link"] = f'<{url_for(".get_vehicles", **args)}>; rel="next"'
+        return response, 200
+    except Error as e:
         return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
 
-@app.route('/vehicle', methods=['POST'])
+@bp.route('/vehicle/export', methods=['GET'])
+def export_vehicles():
+    """Stream the vehicles matching the listing filters as CSV, NDJSON or Parquet, straight from COPY."""
+    export_format = request.args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": "Bad Request", "message": "'format' must be 'csv', 'ndjson' or 'parquet'."}), 400
+
+    filters, errors = parse_vehicle_filters(request.args)
+    sort = parse_sort(request.args.get("sort"))
+    if sort is None:
+        errors["sort"] = "'sort' must be one of " + ", ".join(f"'{column}'" for column in SORT_COLUMNS) + ", optionally prefixed with '-'."
+    if errors:
+        return jsonify({"error": "Bad Request", "message": "Invalid query parameters", "details": errors}), 400
+    if export_format == "parquet" and not parquet_supported():
+        return jsonify({"error": "Not Implemented", "message": "Parquet exports need pyarrow installed on the server."}), 501
+
+    # Parquet files are compressed internally
+    gzipped = export_format != "parquet" and request.accept_encodings["gzip"] > 0
+    if request.method == "HEAD":
+        # The body would never be read, so don't run the COPY
+        return _export_response(export_format, gzipped, iter(()))
+    query, params = build_vehicle_query(filters, sort)
+    try:
+        stream = CopyStream(build_copy_query(query, export_format), params).start()
+    except Error as e:
+        return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
+
+    def generate():
+        try:
+            if export_format == "parquet":
+                yield from iter_parquet(stream)
+            elif gzipped:
+                yield from iter_gzip(stream)
+            else:
+                yield from stream
+        finally:
+            stream.close()
+
+    response = _export_response(export_format, gzipped, generate())
+    # The server closes the response even when the body is never iterated, which leaves generate()'s finally unrun
+    response.call_on_close(stream.close)
+    return response
+
+def _export_response(export_format, gzipped, body):
+    response = Response(body, status=200, mimetype=EXPORT_FORMATS[export_format])
+    response.headers["Content-Disposition"] = f'attachment; filename="vehicles.{export_format}"'
+    response.headers["Vary"] = "Accept-Encoding"
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+@bp.route('/vehicle/stats', methods=['GET'])
+def get_vehicle_stats():
+    """Report vehicle counts per manufacturer and fuel type and price and power per model year."""
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                stats = read_stats(cursor)
+        return jsonify(stats), 200
+    except Error as e:
+        return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
+
+@bp.route('/vehicle/changes', methods=['GET'])
+def get_vehicle_changes():
+    """Stream vehicle inserts, updates and deletes as Server-Sent Events, resuming after Last-Event-ID."""
+    if not request.environ.get("wsgi.multithread"):
+        # A sync worker serves one request at a time, so a stream would shut it out of every other route
+        return jsonify({"error": "Service Unavailable",
+                        "message": "Change streams need SERVER_MODE=asgi or a threaded server."}), 503
+    try:
+        position, opening = open_stream(request.headers.get("Last-Event-ID"))
+    except ValueError:
+        return jsonify({"error": "Bad Request", "message": "Invalid Last-Event-ID."}), 400
+    except Error as e:
+        return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
+
+    response = Response(iter_stream(position, opening, CHANGE_STREAM_MAX_SECONDS), status=200, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# Adds each new vehicle unless its VIN is taken, returning the VINs added with their STATS_COLUMNS
+INSERT_VEHICLES_QUERY = (
+    "INSERT INTO vehicles_schema.vehicles (" + ", ".join(VEHICLE_COLUMNS) + ") VALUES %s"
+    " ON CONFLICT (vin) DO NOTHING RETURNING vin, " + ", ".join(STATS_COLUMNS) + ";"
+)
+
+def _insert_vehicles(vehicles):
+    """Insert validated vehicles with one statement and one commit, returning whether each was added.
+
+    A vehicle is not added if its VIN already exists or belongs to an earlier
+    vehicle in the list. Rows are inserted in VIN order, so concurrent callers
+    lock the VIN index in the same order.
+    """
+    rows = sorted((tuple(vehicle.get(column) for column in VEHICLE_COLUMNS) for vehicle in vehicles), key=lambda row: row[0])
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            inserted = execute_values(cursor, INSERT_VEHICLES_QUERY, rows, page_size=len(rows), fetch=True)
+            stats = StatsDelta()
+            for row in inserted:
+                stats.add(row[1:])
+            stats.apply(cursor)
+            added = {row[0] for row in inserted}
+            publish_invalidations(cursor, sorted(added))
+        conn.commit()
+    for vin in added:
+        vin_cache.invalidate(vin)
+    if added:
+        collection_snapshots.invalidate()
+    results = []
+    for vehicle in vehicles:
+        results.append(vehicle["vin"] in added)
+        added.discard(vehicle["vin"])
+    return results
+
+def _insert_vehicle_group(vehicles):
+    """Insert a group of concurrently posted vehicles, returning True, False or the exception for each."""
+    try:
+        return _insert_vehicles(vehicles)
+    except Exception:
+        if len(vehicles) == 1:
+            raise
+    # One failing vehicle, whatever the failure, must not fail the rest of its group
+    results = []
+    for vehicle in vehicles:
+        try:
+            results.append(_insert_vehicles([vehicle])[0])
+        except Exception as e:
+            results.append(e)
+    return results
+
+vehicle_group_committer = (
+    GroupCommitter(_insert_vehicle_group, GROUP_COMMIT_WINDOW_MS / 1000, GROUP_COMMIT_MAX_SIZE)
+    if GROUP_COMMIT_WINDOW_MS > 0 else None
+)
+
+@bp.route('/vehicle', methods=['POST'])
 def create_vehicle():
-    """Add a new vehicle."""
+    """Add a new vehicle, committed with others posted at the same time when group commit is on."""
     try:
         try:
             data = request.get_json(force=True)
@@ -119,80 +341,241 @@ def create_vehicle():
         if not data:
             return jsonify({"error": "Bad Request", "message": "No JSON data provided"}), 400
 
-        required_fields = ["vin", "manufacturer_name", "model_name", "model_year", "fuel_type"]
-        errors = {}
-
-        # Validate required fields
-        for field in required_fields:
-            if field not in data or data[field] in [None, '']:
-                errors[field] = f"'{field}' is required."
-
-        # Validate data types
-        if "model_year" in data and not isinstance(data["model_year"], int):
-            errors["model_year"] = "'model_year' must be an integer."
-        if "horse_power" in data and data["horse_power"] is not None and not isinstance(data["horse_power"], int):
-            errors["horse_power"] = "'horse_power' must be an integer."
-        if "purchase_price" in data and data["purchase_price"] is not None and not isinstance(data["purchase_price"], (int, float)):
-            errors["purchase_price"] = "'purchase_price' must be a number."
-
+        # Column limits too, so a value the table would reject cannot fail a whole group's insert
+        errors = validate_column_limits(data, validate_new_vehicle(data))
         if errors:
             return jsonify({"error": "Unprocessable Entity", "message": "Validation failed", "details": errors}), 422
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        insert_query = """
-        INSERT INTO vehicles_schema.vehicles (vin, manufacturer_name, description, horse_power, model_name, model_year, purchase_price, fuel_type)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-        """
-        cursor.execute(insert_query, (
-            data["vin"],
-            data["manufacturer_name"],
-            data.get("description"),
-            data.get("horse_power"),
-            data["model_name"],
-            data["model_year"],
-            data.get("purchase_price"),
-            data["fuel_type"],
-        ))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        if vehicle_group_committer is not None:
+            added = vehicle_group_committer.submit(data)
+            if isinstance(added, Exception):
+                raise added
+        else:
+            added = _insert_vehicles([data])[0]
+        if not added:
+            return jsonify({"error": "Conflict", "message": "A vehicle with this VIN already exists."}), 409
         return jsonify({"message": "Vehicle added successfully"}), 201
     except Error as e:
         return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
 
-@app.route('/vehicle/<string:vin>', methods=['GET'])
+_MALFORMED = object()
+
+def _iter_lines(stream, chunk_size=1 << 16):
+    """Split a request body stream into lines, reading it in large chunks."""
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+def _iter_ndjson_records(stream):
+    """Yield ``(index, record)`` for each non-blank line of an NDJSON body."""
+    index = 0
+    for line in _iter_lines(stream):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = _MALFORMED
+        yield index, record
+        index += 1
+
+@bp.route('/vehicle/bulk', methods=['POST'])
+def bulk_create_vehicles():
+    """Add many vehicles in one transaction, reporting the rows that were rejected."""
+    on_conflict = request.args.get("on_conflict", "fail")
+    if on_conflict not in CONFLICT_POLICIES:
+        return jsonify({"error": "Bad Request", "message": "'on_conflict' must be one of 'fail', 'skip' or 'upsert'."}), 400
+
+    if request.mimetype == "application/x-ndjson":
+        records = _iter_ndjson_records(request.stream)
+    else:
+        try:
+            data = request.get_json(force=True)
+        except Exception:
+            return jsonify({"error": "Bad Request", "message": "Invalid JSON data"}), 400
+        if not isinstance(data, list):
+            return jsonify({"error": "Bad Request", "message": "Request body must be a JSON array of vehicles."}), 400
+        records = enumerate(data)
+
+    received = 0
+    rejected = []
+    seen_vins = set()
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                loader = BulkLoader(cursor, BULK_CHUNK_SIZE)
+                for index, record in records:
+                    received += 1
+                    if record is _MALFORMED:
+                        errors = {"row": "Invalid JSON data"}
+                    elif not isinstance(record, dict):
+                        errors = {"row": "Each vehicle must be a JSON object."}
+                    else:
+                        errors = validate_column_limits(record, validate_new_vehicle(record))
+                        if not errors and record["vin"] in seen_vins:
+                            errors = {"vin": "Duplicate VIN in request."}
+                    if errors:
+                        rejected.append({"index": index, "details": errors})
+                        continue
+                    seen_vins.add(record["vin"])
+                    loader.add(index, record)
+
+                stats = StatsDelta()
+                if on_conflict == "upsert":
+                    inserted, updated, previous = loader.upsert(STATS_COLUMNS)
+                    duplicates = []
+                    for row in previous:
+                        stats.remove(row)
+                else:
+                    inserted, updated, duplicates = loader.merge(on_conflict)
+                if duplicates and on_conflict == "fail":
+                    return jsonify({
+                        "error": "Conflict",
+                        "message": "Vehicles with these VINs already exist; nothing was added.",
+                        "duplicates": duplicates,
+                        "rejected": rejected,
+                    }), 409
+                for row in loader.staged_rows(STATS_COLUMNS, exclude=duplicates):
+                    stats.add(row)
+                stats.apply(cursor)
+                publish_invalidation(cursor, INVALIDATE_ALL)
+            conn.commit()
+        vin_cache.clear()
+        collection_snapshots.invalidate()
+
+        return jsonify({
+            "message": "Bulk load completed",
+            "received": received,
+            "inserted": inserted,
+            "updated": updated,
+            "skipped": len(duplicates),
+            "duplicates": duplicates,
+            "rejected": rejected,
+        }), 200
+    except Error as e:
+        return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
+
+def _load_vehicle(vin):
+    """Fetch a vehicle as ``(body, row_version)``, or return None if it does not exist."""
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SELECT_VEHICLE_VERSION, (vin,))
+            row = cursor.fetchone()
+
+    if not row:
+        return None
+    with phase("serialize"):
+        return vehicle_layout.encode(row[:-1]), row[-1]
+
+def _requested_vins():
+    """Return the de-duplicated VINs of a batch request, in order, and an error response if invalid."""
+    try:
+        data = request.get_json(force=True)
+    except Exception:
+        return None, (jsonify({"error": "Bad Request", "message": "Invalid JSON data"}), 400)
+
+    vins = data.get("vins") if isinstance(data, dict) else None
+    if not isinstance(vins, list) or not all(isinstance(vin, str) for vin in vins):
+        return None, (jsonify({"error": "Bad Request", "message": "Request body must be an object with a 'vins' array of strings."}), 400)
+    if len(vins) > MAX_BATCH_VINS:
+        return None, (jsonify({"error": "Bad Request", "message": f"At most {MAX_BATCH_VINS} VINs can be sent per request."}), 400)
+    return list(dict.fromkeys(vins)), None
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+@bp.route('/vehicle/lookup', methods=['POST'])
+def lookup_vehicles():
+    """Fetch many vehicles by VIN, reporting the VINs that do not exist."""
+    vins, error = _requested_vins()
+    if error:
+        return error
+
+    try:
+        # Read straight from the table: a reconciliation sweep would only evict the VIN cache's hot entries
+        rows = {}
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                for chunk in _chunks(vins, BATCH_CHUNK_SIZE):
+                    cursor.execute(SELECT_VEHICLES_BY_VIN, (chunk,))
+                    for row in cursor.fetchall():
+                        rows[row[0]] = row
+
+        with phase("serialize"):
+            found = b",".join(
+                json.dumps(vin).encode() + b":" + vehicle_layout.encode(rows[vin]) for vin in vins if vin in rows
+            )
+            missing = json.dumps([vin for vin in vins if vin not in rows], separators=(",", ":")).encode()
+            body = b'{"vehicles":{' + found + b'},"missing":' + missing + b'}\n'
+        return Response(body, status=200, mimetype="application/json")
+    except Error as e:
+        return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
+
+@bp.route('/vehicle/delete', methods=['POST'])
+def delete_vehicles():
+    """Delete many vehicles by VIN, reporting which were deleted and which did not exist."""
+    vins, error = _requested_vins()
+    if error:
+        return error
+
+    try:
+        deleted = set()
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                stats = StatsDelta()
+                for chunk in _chunks(vins, BATCH_CHUNK_SIZE):
+                    cursor.execute("DELETE FROM vehicles_schema.vehicles WHERE vin = ANY(%s)" + RETURNING_STATS + ", vin;", (chunk,))
+                    for row in cursor.fetchall():
+                        stats.remove(row[:-1])
+                        deleted.add(row[-1])
+                stats.apply(cursor)
+                publish_invalidations(cursor, deleted)
+            conn.commit()
+        for vin in deleted:
+            vin_cache.invalidate(vin)
+        collection_snapshots.invalidate()
+
+        return jsonify({
+            "deleted": [vin for vin in vins if vin in deleted],
+            "missing": [vin for vin in vins if vin not in deleted],
+        }), 200
+    except Error as e:
+        return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
+
+@bp.route('/vehicle/<string:vin>', methods=['GET'])
 def get_vehicle_by_vin(vin):
     """Fetch a vehicle by VIN."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM vehicles_schema.vehicles WHERE vin = %s;", (vin,))
-        row = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        if not row:
+        vehicle = vin_cache.get_or_load(vin, lambda: _load_vehicle(vin))
+        if vehicle is None:
             return jsonify({"error": "Vehicle not found"}), 404
 
-        vehicle = {
-            "vin": row[0],
-            "manufacturer_name": row[1],
-            "description": row[2],
-            "horse_power": row[3],
-            "model_name": row[4],
-            "model_year": row[5],
-            "purchase_price": float(row[6]) if row[6] else None,
-            "fuel_type": row[7],
-        }
-        return jsonify(vehicle), 200
+        body, version = vehicle
+        response = Response(body, status=200, mimetype="application/json")
+        response.set_etag(str(version))
+        return response
     except Error as e:
         return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
 
-@app.route('/vehicle/<string:vin>', methods=['PUT'])
+def _if_match_versions():
+    """Return the row versions allowed by If-Match, or None if any version will do."""
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    # Strong comparison: weak or foreign ETags never match
+    return [int(tag) for tag in if_match.as_set() if tag.isascii() and tag.isdigit()]
+
+@bp.route('/vehicle/<string:vin>', methods=['PUT', 'PATCH'])
 def update_vehicle(vin):
-    """Update a vehicle record."""
+    """Update the given fields of a vehicle record, optionally only if it still matches If-Match."""
     try:
         try:
             data = request.get_json(force=True)
@@ -202,77 +585,80 @@ def update_vehicle(vin):
         if not data:
             return jsonify({"error": "Bad Request", "message": "No JSON data provided"}), 400
 
-        # Check if vehicle exists
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT vin FROM vehicles_schema.vehicles WHERE vin = %s;", (vin,))
-        if not cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({"error": "Vehicle not found"}), 404
-
-        # Validate data types
-        errors = {}
-        if "model_year" in data and data["model_year"] is not None and not isinstance(data["model_year"], int):
-            errors["model_year"] = "'model_year' must be an integer."
-        if "horse_power" in data and data["horse_power"] is not None and not isinstance(data["horse_power"], int):
-            errors["horse_power"] = "'horse_power' must be an integer."
-        if "purchase_price" in data and data["purchase_price"] is not None and not isinstance(data["purchase_price"], (int, float)):
-            errors["purchase_price"] = "'purchase_price' must be a number."
-
+        updates = {key: data[key] for key in UPDATABLE_FIELDS if key in data}
+        errors = validate_vehicle_update(updates)
         if errors:
             return jsonify({"error": "Unprocessable Entity", "message": "Validation failed", "details": errors}), 422
 
-        # Build the UPDATE query dynamically based on provided fields
-        fields = []
-        values = []
-        for key in ['manufacturer_name', 'description', 'horse_power', 'model_name', 'model_year', 'purchase_price', 'fuel_type']:
-            if key in data:
-                fields.append(sql.Identifier(key))
-                values.append(data[key])
-
-        if not fields:
+        if not updates:
             return jsonify({"error": "Unprocessable Entity", "message": "No valid fields provided for update"}), 422
 
-        update_query = sql.SQL("""
-            UPDATE vehicles_schema.vehicles
-            SET ({fields}) = ROW({placeholders})
-            WHERE vin = %s;
-        """).format(
-            fields=sql.SQL(', ').join(fields),
-            placeholders=sql.SQL(', ').join(sql.Placeholder() * len(fields))
-        )
-
-        cursor.execute(update_query, values + [vin])
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        return jsonify({"message": "Vehicle updated successfully"}), 200
+        versions = _if_match_versions()
+        params = list(updates.values()) + [vin]
+        if versions is not None:
+            params.append(versions)
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Check existence and If-Match, update, and read the result back in one statement
+                cursor.execute(build_update_query(list(updates), versions), params)
+                row = cursor.fetchone()
+                if not row:
+                    cursor.execute("SELECT row_version FROM vehicles_schema.vehicles WHERE vin = %s;", (vin,))
+                    current = cursor.fetchone()
+                    if not current:
+                        return jsonify({"error": "Vehicle not found"}), 404
+                    response = jsonify({"error": "Precondition Failed", "message": "The vehicle has changed since the given ETag."})
+                    response.set_etag(str(current[0]))
+                    return response, 412
+
+                vehicle, version, old_stats = row[:len(VEHICLE_COLUMNS)], row[len(VEHICLE_COLUMNS)], row[len(VEHICLE_COLUMNS) + 1:]
+                stats = StatsDelta()
+                stats.replace(old_stats, [vehicle[VEHICLE_COLUMNS.index(column)] for column in STATS_COLUMNS])
+                stats.apply(cursor)
+                publish_invalidation(cursor, vin)
+            conn.commit()
+        vin_cache.invalidate(vin)
+        collection_snapshots.invalidate()
+
+        with phase("serialize"):
+            body = b'{"message":"Vehicle updated successfully","vehicle":' + vehicle_layout.encode(vehicle) + b'}\n'
+        response = Response(body, status=200, mimetype="application/json")
+        response.set_etag(str(version))
+        return response
     except Error as e:
         return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
 
-@app.route('/vehicle/<string:vin>', methods=['DELETE'])
+@bp.route('/vehicle/<string:vin>', methods=['DELETE'])
 def delete_vehicle(vin):
-    """Delete a vehicle record."""
+    """Delete a vehicle record, optionally only if it still matches If-Match."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM vehicles_schema.vehicles WHERE vin = %s;", (vin,))
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({"error": "Vehicle not found"}), 404
-        conn.commit()
-        cursor.close()
-        conn.close()
+        versions = _if_match_versions()
+        query = "DELETE FROM vehicles_schema.vehicles WHERE vin = %s"
+        params = [vin]
+        if versions is not None:
+            query += " AND row_version = ANY(%s)"
+            params.append(versions)
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query + RETURNING_STATS + ";", params)
+                if cursor.rowcount == 0:
+                    if versions is None:
+                        return jsonify({"error": "Vehicle not found"}), 404
+                    cursor.execute("SELECT row_version FROM vehicles_schema.vehicles WHERE vin = %s;", (vin,))
+                    current = cursor.fetchone()
+                    if not current:
+                        return jsonify({"error": "Vehicle not found"}), 404
+                    response = jsonify({"error": "Precondition Failed", "message": "The vehicle has changed since the given ETag."})
+                    response.set_etag(str(current[0]))
+                    return response, 412
+                stats = StatsDelta()
+                stats.remove(cursor.fetchone())
+                stats.apply(cursor)
+                publish_invalidation(cursor, vin)
+            conn.commit()
+        vin_cache.invalidate(vin)
+        collection_snapshots.invalidate()
 
         return '', 204  # Return No Content
     except Error as e:
         return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
-
-# Only initialize the database in development
-#if __name__ == '__main__':
-    #if os.getenv("ENV") != "production":
-        #initialize_database()
-    #app.run(debug=True, host="0.0.0.0", port=int(os.getenv("PORT", 5000)))
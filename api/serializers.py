@@ -0,0 +1,90 @@
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii
+
+from api.models import VEHICLE_COLUMNS
+
+
+def _encode_decimal(value):
+    # Keep the column's exact digits; NaN and infinities have no JSON form
+    return str(value) if value.is_finite() else "null"
+
+
+# Column type -> function producing the JSON text of a non-NULL value
+ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    Decimal: _encode_decimal,
+}
+
+
+class RowLayout:
+    """A column layout compiled into a function that turns row tuples into JSON.
+
+    The encoder is generated once per layout, so encoding a row is one tuple
+    unpack plus one string format, with no intermediate dict and no generic
+    type dispatch. Rows must have exactly the layout's columns, in order.
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(name for name, _ in columns)
+        template = "{" + ",".join(f"{encode_basestring_ascii(name)}:%s" for name, _ in columns) + "}"
+        names = [f"v{i}" for i in range(len(columns))]
+        values = [f"'null' if {name} is None else e{i}({name})" for i, name in enumerate(names)]
+        source = (
+            "def encode_row(row):\n"
+            f"    {', '.join(names)}, = row\n"
+            f"    return _template % ({', '.join(values)},)\n"
+        )
+        namespace = {"_template": template}
+        namespace.update((f"e{i}", ENCODERS[column_type]) for i, (_, column_type) in enumerate(columns))
+        exec(source, namespace)
+        self.encode_row = namespace["encode_row"]
+
+    def encode(self, row):
+        """Encode one row as a JSON object."""
+        return self.encode_row(row).encode()
+
+    def encode_array(self, rows):
+        """Encode rows as a JSON array."""
+        return ("[" + ",".join(map(self.encode_row, rows)) + "]").encode()
+
+    def iter_json_array(self, rows, chunk_size):
+        """Encode a row iterator as a streamed JSON array of ``chunk_size``-row chunks."""
+        yield b"["
+        separator = ""
+        chunk = []
+        for row in rows:
+            chunk.append(self.encode_row(row))
+            if len(chunk) >= chunk_size:
+                yield (separator + ",".join(chunk)).encode()
+                separator = ","
+                chunk = []
+        if chunk:
+            yield (separator + ",".join(chunk)).encode()
+        yield b"]"
+
+    def iter_ndjson(self, rows, chunk_size):
+        """Encode a row iterator as streamed NDJSON of ``chunk_size``-row chunks."""
+        chunk = []
+        for row in rows:
+            chunk.append(self.encode_row(row))
+            if len(chunk) >= chunk_size:
+                yield ("\n".join(chunk) + "\n").encode()
+                chunk = []
+        if chunk:
+            yield ("\n".join(chunk) + "\n").encode()
+
+
+VEHICLE_TYPES = {
+    "vin": str,
+    "manufacturer_name": str,
+    "description": str,
+    "horse_power": int,
+    "model_name": str,
+    "model_year": int,
+    "purchase_price": Decimal,
+    "fuel_type": str,
+}
+
+# Layout of rows selected with SELECT_VEHICLES
+vehicle_layout = RowLayout([(column, VEHICLE_TYPES[column]) for column in VEHICLE_COLUMNS])
@@ -0,0 +1,150 @@
+import gzip
+import os
+import threading
+
+from api.changes import CHANGES_CHANNEL
+from api.db import db_connection
+from api.listener import listening
+from api.queries import build_vehicle_query
+from api.serializers import vehicle_layout
+
+# Largest serialized collection a worker keeps in memory; bigger collections are streamed as before
+SNAPSHOT_MAX_BYTES = int(os.getenv("COLLECTION_SNAPSHOT_MAX_BYTES", 64 * 1024 * 1024))
+# zlib level of the precompressed copy, paid once per table version rather than per response
+SNAPSHOT_GZIP_LEVEL = int(os.getenv("COLLECTION_SNAPSHOT_GZIP_LEVEL", 6))
+# Rows fetched per round trip while building a snapshot
+SNAPSHOT_ITERSIZE = 2000
+# Counter rows the table version is spread over, so concurrent writers rarely wait on each other
+VERSION_SHARDS = 16
+
+# The vehicles table's version is the number of writing statements committed
+# against it. A statement trigger bumps one of several counter rows, picked by
+# backend PID, inside the writing transaction, so the version a reader sums is
+# exactly the one matching the rows in its snapshot. It also signals the change
+# feed channel, which PostgreSQL folds into one notification per transaction.
+TABLE_VERSION_QUERY = f"""
+CREATE TABLE IF NOT EXISTS vehicles_schema.vehicles_version (
+    shard INT PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+INSERT INTO vehicles_schema.vehicles_version (shard, version)
+SELECT shard, 0 FROM generate_series(0, {VERSION_SHARDS - 1}) AS shard
+ON CONFLICT (shard) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION vehicles_schema.bump_vehicles_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE vehicles_schema.vehicles_version SET version = version + 1
+    WHERE shard = pg_backend_pid() % {VERSION_SHARDS};
+    PERFORM pg_notify('{CHANGES_CHANNEL}', '');
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS vehicles_bump_version ON vehicles_schema.vehicles;
+CREATE TRIGGER vehicles_bump_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON vehicles_schema.vehicles
+FOR EACH STATEMENT EXECUTE FUNCTION vehicles_schema.bump_vehicles_version();
+"""
+
+SELECT_TABLE_VERSION = "SELECT sum(version)::bigint FROM vehicles_schema.vehicles_version;"
+
+
+def read_table_version(cursor):
+    """Return the vehicles table's current version."""
+    cursor.execute(SELECT_TABLE_VERSION)
+    return cursor.fetchone()[0]
+
+
+def collection_etag(version, response_format, gzipped):
+    """Return the ETag of the full collection at ``version`` in one representation."""
+    return f"{version}-{response_format}" + ("-gzip" if gzipped else "")
+
+
+class Snapshot:
+    """The full collection serialized at one table version.
+
+    ``body`` and ``gzip_body`` are None when the collection was too large to keep.
+    """
+
+    __slots__ = ("version", "body", "gzip_body")
+
+    def __init__(self, version, body, gzip_body):
+        self.version = version
+        self.body = body
+        self.gzip_body = gzip_body
+
+
+class CollectionSnapshots:
+    """This worker's serialized snapshots of the full vehicle collection, one per format.
+
+    The table version confirmed by the last check is trusted until a write is
+    announced on the change feed channel, so unchanged polls skip the database.
+    Snapshots are rebuilt on the first request that finds them outdated, once
+    per format even when many requests find it at the same time.
+    """
+
+    def __init__(self, max_bytes=SNAPSHOT_MAX_BYTES, gzip_level=SNAPSHOT_GZIP_LEVEL):
+        self.max_bytes = max_bytes
+        self.gzip_level = gzip_level
+        self._lock = threading.Lock()
+        self._build_locks = {"json": threading.Lock(), "ndjson": threading.Lock()}
+        self._snapshots = {}
+        self._version = None
+        self._generation = 0
+
+    def invalidate(self, payload=None):
+        """Stop trusting the last confirmed version; called for every announced write."""
+        with self._lock:
+            self._generation += 1
+            self._version = None
+
+    def current_version(self):
+        """Return the table version, reading it from the database unless it is trusted."""
+        with self._lock:
+            version, generation = self._version, self._generation
+        if version is not None and listening():
+            return version
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                version = read_table_version(cursor)
+        with self._lock:
+            # A write announced during the read may not be counted in it
+            if generation == self._generation:
+                self._version = version
+        return version
+
+    def get(self, response_format, version):
+        """Return the ``response_format`` snapshot at ``version`` or newer, building it if needed."""
+        snapshot = self._snapshots.get(response_format)
+        if snapshot is not None and snapshot.version >= version:
+            return snapshot
+        with self._build_locks[response_format]:
+            snapshot = self._snapshots.get(response_format)
+            if snapshot is None or snapshot.version < version:
+                with db_connection() as conn:
+                    snapshot = self._build(conn, response_format)
+                self._snapshots[response_format] = snapshot
+        return snapshot
+
+    def _build(self, conn, response_format):
+        # One REPEATABLE READ transaction, so the version matches the rows read
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+            version = read_table_version(cursor)
+        chunks = []
+        size = 0
+        with conn.cursor(name="vehicles_snapshot") as cursor:
+            cursor.itersize = SNAPSHOT_ITERSIZE
+            cursor.execute(*build_vehicle_query({}))
+            encode = vehicle_layout.iter_ndjson if response_format == "ndjson" else vehicle_layout.iter_json_array
+            for chunk in encode(cursor, SNAPSHOT_ITERSIZE):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    return Snapshot(version, None, None)
+                chunks.append(chunk)
+        body = b"".join(chunks)
+        return Snapshot(version, body, gzip.compress(body, compresslevel=self.gzip_level, mtime=0))
+
+
+collection_snapshots = CollectionSnapshots()
@@ -0,0 +1,291 @@
+import argparse
+import sys
+
+from psycopg2.extras import execute_values
+
+# Columns a vehicle contributes to the fleet statistics, in this order
+STATS_COLUMNS = ("manufacturer_name", "fuel_type", "model_year", "purchase_price", "horse_power")
+RETURNING_STATS = " RETURNING " + ", ".join(STATS_COLUMNS)
+# Columns whose distinct values are counted
+COUNTED_COLUMNS = ("manufacturer_name", "fuel_type")
+# Columns summarized per model year
+MEASURED_COLUMNS = ("purchase_price", "horse_power")
+
+STATS_TABLES_QUERY = """
+CREATE TABLE IF NOT EXISTS vehicles_schema.vehicle_counts (
+    dimension VARCHAR(32) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    vehicles BIGINT NOT NULL,
+    PRIMARY KEY (dimension, value)
+);
+CREATE TABLE IF NOT EXISTS vehicles_schema.vehicle_year_stats (
+    model_year INT PRIMARY KEY,
+    vehicles BIGINT NOT NULL,
+    purchase_price_count BIGINT NOT NULL,
+    purchase_price_sum NUMERIC NOT NULL,
+    purchase_price_min DECIMAL(10, 2),
+    purchase_price_max DECIMAL(10, 2),
+    horse_power_count BIGINT NOT NULL,
+    horse_power_sum BIGINT NOT NULL,
+    horse_power_min INT,
+    horse_power_max INT
+);
+"""
+
+# Full aggregations over the vehicles table, column-compatible with the summary tables
+COUNTS_QUERY = """
+    SELECT 'manufacturer_name', manufacturer_name, count(*) FROM vehicles_schema.vehicles GROUP BY manufacturer_name
+    UNION ALL
+    SELECT 'fuel_type', fuel_type, count(*) FROM vehicles_schema.vehicles GROUP BY fuel_type
+"""
+YEAR_STATS_QUERY = """
+    SELECT model_year, count(*),
+           count(purchase_price), coalesce(sum(purchase_price), 0), min(purchase_price), max(purchase_price),
+           count(horse_power), coalesce(sum(horse_power), 0), min(horse_power), max(horse_power)
+    FROM vehicles_schema.vehicles GROUP BY model_year
+"""
+
+APPLY_COUNTS_QUERY = """
+    INSERT INTO vehicles_schema.vehicle_counts AS c (dimension, value, vehicles) VALUES %s
+    ON CONFLICT (dimension, value) DO UPDATE SET vehicles = c.vehicles + EXCLUDED.vehicles;
+"""
+DELETE_EMPTY_COUNTS_QUERY = """
+    DELETE FROM vehicles_schema.vehicle_counts c USING (VALUES %s) AS d (dimension, value)
+    WHERE c.dimension = d.dimension AND c.value = d.value AND c.vehicles = 0;
+"""
+APPLY_YEARS_QUERY = """
+    INSERT INTO vehicles_schema.vehicle_year_stats AS s VALUES %s
+    ON CONFLICT (model_year) DO UPDATE SET
+        vehicles = s.vehicles + EXCLUDED.vehicles,
+        purchase_price_count = s.purchase_price_count + EXCLUDED.purchase_price_count,
+        purchase_price_sum = s.purchase_price_sum + EXCLUDED.purchase_price_sum,
+        purchase_price_min = LEAST(s.purchase_price_min, EXCLUDED.purchase_price_min),
+        purchase_price_max = GREATEST(s.purchase_price_max, EXCLUDED.purchase_price_max),
+        horse_power_count = s.horse_power_count + EXCLUDED.horse_power_count,
+        horse_power_sum = s.horse_power_sum + EXCLUDED.horse_power_sum,
+        horse_power_min = LEAST(s.horse_power_min, EXCLUDED.horse_power_min),
+        horse_power_max = GREATEST(s.horse_power_max, EXCLUDED.horse_power_max);
+"""
+APPLY_YEARS_TEMPLATE = "(%s, %s, %s, %s, %s::numeric, %s::numeric, %s, %s, %s::int, %s::int)"
+# Recompute a year's extremes from its rows, but only those a removed value may have held
+RECOMPUTE_EXTREMES_QUERY = """
+    UPDATE vehicles_schema.vehicle_year_stats s SET
+        purchase_price_min = CASE WHEN d.purchase_price_min <= s.purchase_price_min
+            THEN (SELECT min(purchase_price) FROM vehicles_schema.vehicles v WHERE v.model_year = s.model_year)
+            ELSE s.purchase_price_min END,
+        purchase_price_max = CASE WHEN d.purchase_price_max >= s.purchase_price_max
+            THEN (SELECT max(purchase_price) FROM vehicles_schema.vehicles v WHERE v.model_year = s.model_year)
+            ELSE s.purchase_price_max END,
+        horse_power_min = CASE WHEN d.horse_power_min <= s.horse_power_min
+            THEN (SELECT min(horse_power) FROM vehicles_schema.vehicles v WHERE v.model_year = s.model_year)
+            ELSE s.horse_power_min END,
+        horse_power_max = CASE WHEN d.horse_power_max >= s.horse_power_max
+            THEN (SELECT max(horse_power) FROM vehicles_schema.vehicles v WHERE v.model_year = s.model_year)
+            ELSE s.horse_power_max END
+    FROM (VALUES %s) AS d (model_year, purchase_price_min, purchase_price_max, horse_power_min, horse_power_max)
+    WHERE s.model_year = d.model_year AND s.vehicles > 0;
+"""
+RECOMPUTE_EXTREMES_TEMPLATE = "(%s, %s::numeric, %s::numeric, %s::int, %s::int)"
+DELETE_EMPTY_YEARS_QUERY = """
+    DELETE FROM vehicles_schema.vehicle_year_stats WHERE model_year = ANY(%s) AND vehicles = 0;
+"""
+
+
+class _Measure:
+    """Net change to one column's summary within one model year."""
+
+    __slots__ = ("count", "total", "added_min", "added_max", "removed_min", "removed_max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.added_min = self.added_max = None
+        self.removed_min = self.removed_max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.added_min = value if self.added_min is None else min(self.added_min, value)
+        self.added_max = value if self.added_max is None else max(self.added_max, value)
+
+    def remove(self, value):
+        self.count -= 1
+        self.total -= value
+        self.removed_min = value if self.removed_min is None else min(self.removed_min, value)
+        self.removed_max = value if self.removed_max is None else max(self.removed_max, value)
+
+
+class StatsDelta:
+    """Changes to the fleet statistics made by one write, applied in its transaction.
+
+    Rows are tuples of ``STATS_COLUMNS`` as stored in the vehicles table,
+    typically read back with ``RETURNING_STATS``. Counts and sums are applied
+    as increments; a year's minimum or maximum is recomputed from its rows
+    only when a removed value could have been it. ``apply`` must run after
+    the vehicles table itself has been written.
+    """
+
+    def __init__(self):
+        self.counts = {}  # (dimension, value) -> change in vehicles
+        self.years = {}  # model_year -> [change in vehicles, {column: _Measure}]
+
+    def add(self, row):
+        """Count a vehicle that was inserted."""
+        self._change(row, 1)
+
+    def remove(self, row):
+        """Uncount a vehicle that was deleted."""
+        self._change(row, -1)
+
+    def replace(self, old, new):
+        """Account for a vehicle whose ``old`` row was overwritten by ``new``."""
+        if tuple(old) != tuple(new):
+            self.remove(old)
+            self.add(new)
+
+    def apply(self, cursor):
+        """Write the accumulated changes to the summary tables.
+
+        Groups are written in key order so concurrent writers lock them in
+        the same order.
+        """
+        counts = sorted(key + (change,) for key, change in self.counts.items() if change)
+        if counts:
+            execute_values(cursor, APPLY_COUNTS_QUERY, counts)
+            emptied = [(dimension, value) for dimension, value, change in counts if change < 0]
+            if emptied:
+                execute_values(cursor, DELETE_EMPTY_COUNTS_QUERY, emptied)
+
+        years = []
+        removed = []
+        emptied = []
+        for model_year, (vehicles, measures) in sorted(self.years.items()):
+            row = [model_year, vehicles]
+            extremes = [model_year]
+            for column in MEASURED_COLUMNS:
+                measure = measures[column]
+                row.extend([measure.count, measure.total, measure.added_min, measure.added_max])
+                extremes.extend([measure.removed_min, measure.removed_max])
+            years.append(row)
+            if any(value is not None for value in extremes[1:]):
+                removed.append(extremes)
+            # A year may lose its last vehicles without losing any measured value, if they were all NULL
+            if vehicles < 0:
+                emptied.append(model_year)
+        if years:
+            execute_values(cursor, APPLY_YEARS_QUERY, years, template=APPLY_YEARS_TEMPLATE)
+        if removed:
+            execute_values(cursor, RECOMPUTE_EXTREMES_QUERY, removed, template=RECOMPUTE_EXTREMES_TEMPLATE)
+        if emptied:
+            cursor.execute(DELETE_EMPTY_YEARS_QUERY, (emptied,))
+
+    def _change(self, row, sign):
+        values = dict(zip(STATS_COLUMNS, row))
+        for column in COUNTED_COLUMNS:
+            key = (column, values[column])
+            self.counts[key] = self.counts.get(key, 0) + sign
+        year = self.years.get(values["model_year"])
+        if year is None:
+            year = self.years[values["model_year"]] = [0, {column: _Measure() for column in MEASURED_COLUMNS}]
+        year[0] += sign
+        for column in MEASURED_COLUMNS:
+            if values[column] is not None:
+                if sign > 0:
+                    year[1][column].add(values[column])
+                else:
+                    year[1][column].remove(values[column])
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+def read_stats(cursor):
+    """Return the fleet statistics served by ``GET /vehicle/stats``."""
+    cursor.execute("SELECT dimension, value, vehicles FROM vehicles_schema.vehicle_counts ORDER BY dimension, value;")
+    counts = {column: {} for column in COUNTED_COLUMNS}
+    for dimension, value, vehicles in cursor.fetchall():
+        counts[dimension][value] = vehicles
+
+    cursor.execute("SELECT * FROM vehicles_schema.vehicle_year_stats ORDER BY model_year;")
+    total = 0
+    by_model_year = []
+    for model_year, vehicles, *measures in cursor.fetchall():
+        total += vehicles
+        entry = {"model_year": model_year, "count": vehicles}
+        for i, column in enumerate(MEASURED_COLUMNS):
+            count, value_sum, value_min, value_max = measures[i * 4:i * 4 + 4]
+            entry[column] = {
+                "avg": round(float(value_sum) / count, 2) if count else None,
+                "min": _number(value_min),
+                "max": _number(value_max),
+            }
+        by_model_year.append(entry)
+
+    return {
+        "total": total,
+        "by_manufacturer": counts["manufacturer_name"],
+        "by_fuel_type": counts["fuel_type"],
+        "by_model_year": by_model_year,
+    }
+
+
+def rebuild_stats(cursor):
+    """Recompute the summary tables from the vehicles table.
+
+    Writes to the vehicles table are blocked until the caller's transaction ends.
+    """
+    cursor.execute("LOCK TABLE vehicles_schema.vehicles IN SHARE MODE;")
+    cursor.execute("DELETE FROM vehicles_schema.vehicle_counts;")
+    cursor.execute("DELETE FROM vehicles_schema.vehicle_year_stats;")
+    cursor.execute("INSERT INTO vehicles_schema.vehicle_counts " + COUNTS_QUERY + ";")
+    cursor.execute("INSERT INTO vehicles_schema.vehicle_year_stats " + YEAR_STATS_QUERY + ";")
+
+
+def check_stats(cursor):
+    """Return ``(table, row)`` pairs where the summary tables disagree with a full aggregation.
+
+    ``row`` is prefixed with ``expected`` (missing from the summary) or
+    ``unexpected`` (present in the summary but not in the aggregation).
+    """
+    differences = []
+    for table, query in (("vehicle_counts", COUNTS_QUERY), ("vehicle_year_stats", YEAR_STATS_QUERY)):
+        cursor.execute(f"""
+            SELECT 'expected', * FROM (({query}) EXCEPT SELECT * FROM vehicles_schema.{table}) AS missing
+            UNION ALL
+            SELECT 'unexpected', * FROM (SELECT * FROM vehicles_schema.{table} EXCEPT ({query})) AS extra;
+        """)
+        differences.extend((table, row) for row in cursor.fetchall())
+    return differences
+
+
+def main(argv=None):
+    """Rebuild or check the fleet statistics summary tables."""
+    parser = argparse.ArgumentParser(prog="python -m api.stats", description=main.__doc__)
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from api.db import get_db_connection
+
+    load_dotenv()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            if args.command == "rebuild":
+                rebuild_stats(cursor)
+                conn.commit()
+                print("Fleet statistics rebuilt.")
+                return 0
+            differences = check_stats(cursor)
+    finally:
+        conn.close()
+
+    for table, row in differences:
+        print(f"{table}: {row[0]} {row[1:]}")
+    print(f"Fleet statistics are {'inconsistent' if differences else 'consistent'}.")
+    return 1 if differences else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
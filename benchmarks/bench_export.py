@@ -0,0 +1,80 @@
+"""Benchmark: GET /vehicle/export in each format against a raw COPY of the same rows.
+
+Needs DATABASE_URL pointing at a migrated database with vehicles in it (for
+example one seeded by ``bench_load.py --database-url``). Responses are read
+through the Flask test client, so the figures exclude the network.
+
+Run from the repository root:
+
+    python benchmarks/bench_export.py [runs]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from api.app import create_app
+from api.export import build_copy_query, parquet_supported
+from api.queries import build_vehicle_query
+
+
+class _Counter:
+    """A file that only counts what COPY writes to it."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def raw_copy(database_url, export_format):
+    """Time a COPY straight into psycopg2, returning ``(seconds, bytes)``."""
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cursor:
+            query, params = build_vehicle_query({})
+            statement = cursor.mogrify(build_copy_query(query, export_format), params).decode()
+            counter = _Counter()
+            start = time.perf_counter()
+            cursor.copy_expert(statement, counter)
+            return time.perf_counter() - start, counter.size
+    finally:
+        conn.close()
+
+
+def export(client, export_format, encoding):
+    """Time one export through the app, returning ``(seconds, bytes)``."""
+    start = time.perf_counter()
+    response = client.get(f"/vehicle/export?format={export_format}", headers={"Accept-Encoding": encoding},
+                          buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return time.perf_counter() - start, size
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        sys.exit("DATABASE_URL is not set")
+    client = create_app({"DATABASE_URL": database_url}).test_client()
+
+    cases = [("raw COPY csv", lambda: raw_copy(database_url, "csv")),
+             ("raw COPY ndjson", lambda: raw_copy(database_url, "ndjson"))]
+    for export_format in ("csv", "ndjson"):
+        for encoding in ("identity", "gzip"):
+            cases.append((f"export {export_format} {encoding}", lambda f=export_format, e=encoding: export(client, f, e)))
+    if parquet_supported():
+        cases.append(("export parquet", lambda: export(client, "parquet", "identity")))
+
+    for name, case in cases:
+        seconds, size = min(case() for _ in range(runs))
+        print(f"{name:>22}: {seconds * 1000:8.1f} ms  {size / 1e6:8.2f} MB  {size / 1e6 / seconds:7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
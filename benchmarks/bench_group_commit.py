@@ -0,0 +1,87 @@
+"""Benchmark: POST /vehicle throughput with and without group commit.
+
+Serves the app once per ``--window`` (a ``GROUP_COMMIT_WINDOW_MS`` value; 0 is
+the per-request commit) and drives it with ``--concurrency`` client threads
+that only create vehicles, each sending its next POST as soon as the last one
+is answered. Every run reports requests per second and latency, and the gain
+over the same concurrency with a window of 0.
+
+Group commit only combines requests a worker serves at the same time, so the
+default server is the ASGI one, whose POSTs run on threads; gunicorn's sync
+workers serve one request at a time and gain nothing.
+
+Like ``bench_load.py`` it starts a throwaway PostgreSQL cluster unless
+``--database-url`` is given, and only writes vehicles whose VIN starts with
+``BENCH``.
+
+Run from the repository root:
+
+    python benchmarks/bench_group_commit.py
+    python benchmarks/bench_group_commit.py --window 0 --window 1 --window 5 --concurrency 16,64 --workers 2
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import Server, TrafficGenerator, clean_up, concurrency_levels, drive, generated, report, seed
+from pgtemp import temporary_postgres
+
+
+def run(args, database_url):
+    """Benchmark every window and concurrency against ``database_url`` and return the results."""
+    seed(database_url, 0)
+    results = []
+    workers = iter(range(1000))
+    for window in args.window:
+        env = {"GROUP_COMMIT_WINDOW_MS": str(window), "GROUP_COMMIT_MAX_SIZE": str(args.max_size)}
+        with Server(args.server, database_url, args.workers, env) as server:
+            for concurrency in args.concurrency:
+                warm_up = [generated(TrafficGenerator(next(workers), 0, {"create": 1})) for _ in range(concurrency)]
+                drive(server.base_url, warm_up, time.monotonic() + args.warmup)
+                sources = [generated(TrafficGenerator(next(workers), 0, {"create": 1})) for _ in range(concurrency)]
+                samples, _, seconds = drive(server.base_url, sources, time.monotonic() + args.duration)
+                name = f"create/w{window:g}/c{concurrency}/{args.server}"
+                results.append(report(name, samples, seconds, window=window, concurrency=concurrency,
+                                      server=args.server))
+                clean_up(database_url)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare POST /vehicle throughput with and without group commit.")
+    parser.add_argument("--window", type=float, action="append",
+                        help="GROUP_COMMIT_WINDOW_MS to run with; repeat for several (default 0 and 2)")
+    parser.add_argument("--max-size", type=int, default=100, help="GROUP_COMMIT_MAX_SIZE (default 100)")
+    parser.add_argument("--concurrency", type=concurrency_levels, default=[8, 32], help="comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per run")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of unmeasured traffic before each run")
+    parser.add_argument("--server", choices=["gunicorn", "asgi"], default="asgi")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--database-url", help="benchmark this database instead of a throwaway cluster")
+    args = parser.parse_args(argv)
+    args.window = args.window or [0, 2]
+
+    if args.database_url:
+        try:
+            results = run(args, args.database_url)
+        finally:
+            clean_up(args.database_url)
+    else:
+        with temporary_postgres() as database_url:
+            results = run(args, database_url)
+
+    baseline = {result["concurrency"]: result["rps"] for result in results if result["window"] == 0}
+    for result in results:
+        gain = ""
+        if baseline.get(result["concurrency"]):
+            gain = f"  x{result['rps'] / baseline[result['concurrency']]:.2f}"
+        print(f"{result['name']:>28}: {result['rps']:9.1f} req/s  p50 {result['p50_ms']:8.2f} ms"
+              f"  p95 {result['p95_ms']:8.2f} ms  errors {result['errors']}{gain}")
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
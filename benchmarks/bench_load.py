@@ -0,0 +1,508 @@
+"""Benchmark: throughput and latency of the /vehicle endpoints under concurrent load.
+
+Starts a throwaway PostgreSQL cluster (see ``pgtemp.py``), seeds it with
+``--rows`` vehicles, serves the app in-process, on gunicorn's sync workers or
+on uvicorn workers, and drives a mixed, read-only or write-only workload from
+``--concurrency`` client threads, each sending its next request as soon as the
+last one is answered. Every run reports requests per second and p50/p95/p99
+latency, overall and per operation.
+
+Requests are generated from a seeded RNG, so two runs of the same command send
+the same traffic. ``--record`` saves the generated requests as JSON lines and
+``--replay`` sends a recording again instead of generating traffic; each line is
+``{"worker", "op", "method", "path", "json", "conditional"}``, and a worker's
+requests are replayed in order by one client thread.
+
+``--output`` writes the results as JSON. ``--baseline`` compares them with
+stored results and exits with status 1 when requests fail, or when throughput
+drops or p50/p95 latency grows by more than ``--tolerance``.
+``--update-baseline`` stores the new results instead. Baselines only mean
+something on the machine that recorded them, so a baseline file records its
+machine, and one from another machine only gates on failed requests.
+
+Run from the repository root:
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --rows 10000 --rows 1000000 --concurrency 1,8,32 --server gunicorn
+    python benchmarks/bench_load.py --record traffic.jsonl --concurrency 8
+    python benchmarks/bench_load.py --replay traffic.jsonl --concurrency 8
+    python benchmarks/bench_load.py --baseline bench_baseline.json --update-baseline
+    python benchmarks/bench_load.py --output results.json --baseline bench_baseline.json
+
+``--database-url`` benchmarks an existing database instead of a throwaway one;
+only vehicles whose VIN starts with ``BENCH`` are written and cleaned up.
+``GET /vehicle/changes`` is not driven: its streams are long-lived, so request
+latency says nothing about them.
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psycopg2
+import requests
+
+from pgtemp import free_port, temporary_postgres
+
+MANUFACTURERS = ["Honda", "Toyota", "Ford", "Tesla", "BMW", "Kia", "Volvo", "Fiat"]
+MODELS = ["Accord", "Corolla", "Focus", "Model 3", "X5", "Sorento", "XC90", "Panda"]
+FUEL_TYPES = ["Gasoline", "Diesel", "Hybrid", "Electric"]
+COLUMNS = ["vin", "manufacturer_name", "description", "horse_power", "model_name", "model_year",
+           "purchase_price", "fuel_type"]
+
+# Relative weights of each operation in the built-in workloads
+WORKLOADS = {
+    "read": {"get_vin": 60, "list_page": 15, "list_filtered": 10, "list_all": 2, "stats": 5, "lookup": 8, "export": 1},
+    "write": {"create": 30, "patch": 30, "put": 10, "delete": 20, "bulk": 5, "batch_delete": 5},
+    "mixed": {
+        "get_vin": 40, "list_page": 10, "list_filtered": 6, "list_all": 2, "stats": 4, "lookup": 5, "export": 1,
+        "create": 10, "patch": 10, "put": 3, "delete": 6, "bulk": 2, "batch_delete": 2,
+    },
+}
+SEED_CHUNK = 50000
+BATCH_SIZE = 100
+# Every VIN the benchmark writes starts with this, so it can clean up after itself
+VIN_PREFIX = "BENCH"
+
+
+def seed_vin(i):
+    return f"{VIN_PREFIX}S{i:011d}"
+
+
+def make_vehicle(vin, rng):
+    """Return a valid vehicle with random attributes."""
+    index = rng.randrange(len(MANUFACTURERS))
+    return {
+        "vin": vin,
+        "manufacturer_name": MANUFACTURERS[index],
+        "description": "Benchmark vehicle",
+        "horse_power": rng.randrange(70, 700),
+        "model_name": MODELS[index],
+        "model_year": rng.randrange(1995, 2026),
+        "purchase_price": round(rng.uniform(5000, 150000), 2),
+        "fuel_type": rng.choice(FUEL_TYPES),
+    }
+
+
+def seed(database_url, rows):
+    """Migrate the database and replace the benchmark's vehicles with ``rows`` seeded ones."""
+    from api.migrations import migrate
+    from api.stats import rebuild_stats
+
+    rng = random.Random(0)
+    conn = psycopg2.connect(database_url)
+    try:
+        migrate(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM vehicles_schema.vehicles WHERE vin LIKE %s;", (VIN_PREFIX + "%",))
+            for start in range(0, rows, SEED_CHUNK):
+                buffer = io.StringIO()
+                for i in range(start, min(start + SEED_CHUNK, rows)):
+                    vehicle = make_vehicle(seed_vin(i), rng)
+                    buffer.write(",".join(str(vehicle[column]) for column in COLUMNS) + "\n")
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY vehicles_schema.vehicles ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv);", buffer,
+                )
+            rebuild_stats(cursor)
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE vehicles_schema.vehicles;")
+    finally:
+        conn.close()
+
+
+def clean_up(database_url):
+    """Delete every vehicle the benchmark wrote."""
+    from api.stats import rebuild_stats
+
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM vehicles_schema.vehicles WHERE vin LIKE %s;", (VIN_PREFIX + "%",))
+            rebuild_stats(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class TrafficGenerator:
+    """Generates one client's requests from a seeded RNG.
+
+    VINs the client creates embed its worker number and are remembered, so it
+    only ever deletes its own vehicles, leaving the seeded rows for the reads.
+    Worker numbers must be unique within a benchmark, and below 1000.
+    """
+
+    def __init__(self, worker, rows, weights, seed=0):
+        self.worker = worker
+        self.rows = rows
+        self.rng = random.Random(seed * 100003 + worker)
+        self.ops = list(weights)
+        self.weights = [weights[op] for op in self.ops]
+        self.created = []
+        self.counter = 0
+
+    def seeded_vin(self):
+        return seed_vin(self.rng.randrange(self.rows))
+
+    def new_vin(self):
+        self.counter += 1
+        return f"{VIN_PREFIX}W{self.worker:03d}{self.counter:08d}"
+
+    def next(self):
+        """Return the next request as a dict."""
+        op = self.rng.choices(self.ops, self.weights)[0]
+        if op in ("delete", "batch_delete") and not self.created:
+            op = "create"
+        method, path, body = getattr(self, "_" + op)()
+        return {"worker": self.worker, "op": op, "method": method, "path": path, "json": body,
+                "conditional": op == "list_all"}
+
+    def _get_vin(self):
+        return "GET", f"/vehicle/{self.seeded_vin()}", None
+
+    def _list_page(self):
+        return "GET", f"/vehicle?limit=100&after={self.seeded_vin()}", None
+
+    def _list_filtered(self):
+        manufacturer = self.rng.choice(MANUFACTURERS)
+        return "GET", f"/vehicle?manufacturer_name={manufacturer}&model_year_min={self.rng.randrange(1995, 2026)}&limit=100", None
+
+    def _list_all(self):
+        return "GET", "/vehicle", None
+
+    def _export(self):
+        manufacturer = self.rng.choice(MANUFACTURERS)
+        return "GET", f"/vehicle/export?format={self.rng.choice(['csv', 'ndjson'])}&manufacturer_name={manufacturer}&model_year_min=2020", None
+
+    def _stats(self):
+        return "GET", "/vehicle/stats", None
+
+    def _lookup(self):
+        return "POST", "/vehicle/lookup", {"vins": [self.seeded_vin() for _ in range(50)]}
+
+    def _create(self):
+        vin = self.new_vin()
+        self.created.append(vin)
+        return "POST", "/vehicle", make_vehicle(vin, self.rng)
+
+    def _patch(self):
+        return "PATCH", f"/vehicle/{self.seeded_vin()}", {"purchase_price": round(self.rng.uniform(5000, 150000), 2)}
+
+    def _put(self):
+        vin = self.seeded_vin()
+        body = make_vehicle(vin, self.rng)
+        del body["vin"]
+        return "PUT", f"/vehicle/{vin}", body
+
+    def _delete(self):
+        return "DELETE", f"/vehicle/{self.created.pop(self.rng.randrange(len(self.created)))}", None
+
+    def _bulk(self):
+        vehicles = [make_vehicle(self.new_vin(), self.rng) for _ in range(BATCH_SIZE)]
+        self.created.extend(vehicle["vin"] for vehicle in vehicles)
+        return "POST", "/vehicle/bulk", vehicles
+
+    def _batch_delete(self):
+        vins, self.created = self.created[-BATCH_SIZE:], self.created[:-BATCH_SIZE]
+        return "POST", "/vehicle/delete", {"vins": vins}
+
+
+def send(session, base_url, request, etags):
+    """Send one request and return ``(status, seconds)``; status is None if it failed to complete."""
+    headers = {}
+    if request.get("conditional") and request["path"] in etags:
+        headers["If-None-Match"] = etags[request["path"]]
+    start = time.perf_counter()
+    try:
+        response = session.request(request["method"], base_url + request["path"], json=request.get("json"),
+                                   headers=headers)
+        response.content
+    except requests.RequestException:
+        return None, time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    if request.get("conditional") and "ETag" in response.headers:
+        etags[request["path"]] = response.headers["ETag"]
+    return response.status_code, elapsed
+
+
+def drive(base_url, sources, deadline=None):
+    """Send each source's requests from its own thread; return ``(samples, recorded, seconds)``.
+
+    A source is an iterator of requests. Samples are ``(op, status, seconds)``.
+    Sources are drained, or abandoned at ``deadline`` (a ``time.monotonic()`` value).
+    """
+    samples = [[] for _ in sources]
+    recorded = [[] for _ in sources]
+
+    def client(index, source):
+        session = requests.Session()
+        etags = {}
+        for request in source:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            status, seconds = send(session, base_url, request, etags)
+            samples[index].append((request["op"], status, seconds))
+            recorded[index].append(request)
+        session.close()
+
+    threads = [threading.Thread(target=client, args=(i, source)) for i, source in enumerate(sources)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return [sample for part in samples for sample in part], [r for part in recorded for r in part], elapsed
+
+
+def generated(generator):
+    while True:
+        yield generator.next()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of a non-empty ascending list."""
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(samples):
+    """Return request, error and latency figures (in milliseconds) for a list of samples."""
+    latencies = sorted(seconds * 1000 for _, _, seconds in samples)
+    errors = sum(1 for _, status, _ in samples if status is None or status >= 500)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50), 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95), 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99), 3) if latencies else None,
+    }
+
+
+def report(name, samples, seconds, **config):
+    """Build one run's result from its samples."""
+    result = dict(name=name, **config, seconds=round(seconds, 3), **summarize(samples))
+    result["rps"] = round(len(samples) / seconds, 1) if seconds else 0.0
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    result["statuses"] = dict(sorted(statuses.items()))
+    ops = {}
+    for sample in samples:
+        ops.setdefault(sample[0], []).append(sample)
+    result["ops"] = {op: summarize(op_samples) for op, op_samples in sorted(ops.items())}
+    return result
+
+
+class Server:
+    """The app under test, served in-process or by a gunicorn subprocess.
+
+    ``env`` adds environment variables to a subprocess's; the in-process server
+    reads its settings from this process's environment.
+    """
+
+    def __init__(self, mode, database_url, workers, env=None):
+        self.mode = mode
+        self.database_url = database_url
+        self.workers = workers
+        self.env = env or {}
+        self.process = None
+        self.server = None
+
+    def __enter__(self):
+        port = free_port()
+        self.base_url = f"http://127.0.0.1:{port}"
+        if self.mode == "inprocess":
+            from werkzeug.serving import make_server
+            from api.app import create_app
+
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+            self.server = make_server("127.0.0.1", port, create_app({"DATABASE_URL": self.database_url}),
+                                      threaded=True)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        else:
+            env = dict(os.environ, **self.env, DATABASE_URL=self.database_url)
+            env["SERVER_MODE"] = "asgi" if self.mode == "asgi" else "wsgi"
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(self.workers),
+                 "-b", f"127.0.0.1:{port}"],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        for _ in range(100):
+            try:
+                requests.get(self.base_url + "/", timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError(f"the {self.mode} server did not start")
+
+    def __exit__(self, *exc):
+        if self.server is not None:
+            self.server.shutdown()
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def load_replay(path):
+    """Read a recording and group its requests by worker, in order."""
+    workers = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                request = json.loads(line)
+                workers.setdefault(request.get("worker", 0), []).append(request)
+    return [workers[worker] for worker in sorted(workers)]
+
+
+def machine():
+    """Describe this machine, so baselines are only compared on the one that recorded them."""
+    return {"node": platform.node(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "python": platform.python_version()}
+
+
+def compare(results, baseline, tolerance):
+    """Return a message for every run that regressed past its baseline.
+
+    Throughput and latency are only compared with a baseline recorded on this
+    machine; failed requests are regressions anywhere.
+    """
+    regressions = []
+    same_machine = baseline.get("machine") == machine()
+    if not same_machine:
+        print("The baseline was recorded on another machine; only failed requests are checked.")
+    for result in results:
+        expected = baseline.get("results", {}).get(result["name"])
+        if result["errors"]:
+            regressions.append(f"{result['name']}: {result['errors']} failed requests")
+        if expected is None or not same_machine:
+            continue
+        if result["rps"] < expected["rps"] * (1 - tolerance):
+            regressions.append(f"{result['name']}: {result['rps']} req/s, x{result['rps'] / expected['rps']:.2f} of "
+                               f"baseline {expected['rps']}")
+        # p99 of a short run is too noisy to gate on; it is reported only
+        for metric in ("p50_ms", "p95_ms"):
+            if result[metric] is not None and result[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(f"{result['name']}: {metric} {result[metric]:.2f}, "
+                                   f"x{result[metric] / expected[metric]:.2f} of baseline {expected[metric]:.2f}")
+    return regressions
+
+
+def run(args, database_url):
+    """Run every configured benchmark against ``database_url`` and return the results."""
+    replay = load_replay(args.replay) if args.replay else None
+    results = []
+    recorded = []
+    workers = iter(range(1000))
+    for rows in args.rows:
+        seed(database_url, rows)
+        with Server(args.server, database_url, args.workers) as server:
+            for concurrency in args.concurrency:
+                if replay is not None:
+                    sources = [iter([r for part in replay[i::concurrency] for r in part]) for i in range(concurrency)]
+                    samples, sent, seconds = drive(server.base_url, sources)
+                else:
+                    weights = WORKLOADS[args.workload]
+                    warm_up = [generated(TrafficGenerator(next(workers), rows, weights, args.seed))
+                               for _ in range(concurrency)]
+                    drive(server.base_url, warm_up, time.monotonic() + args.warmup)
+                    sources = [generated(TrafficGenerator(next(workers), rows, weights, args.seed))
+                               for _ in range(concurrency)]
+                    samples, sent, seconds = drive(server.base_url, sources, time.monotonic() + args.duration)
+                    recorded.extend(sent)
+                workload = "replay" if replay is not None else args.workload
+                name = f"{workload}/{rows}/c{concurrency}/{args.server}"
+                result = report(name, samples, seconds, workload=workload, rows=rows, concurrency=concurrency,
+                                server=args.server)
+                results.append(result)
+                print(f"{name:>32}: {result['rps']:9.1f} req/s  p50 {result['p50_ms']:8.2f} ms"
+                      f"  p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  errors {result['errors']}")
+    if args.record:
+        with open(args.record, "w") as f:
+            for request in recorded:
+                f.write(json.dumps(request) + "\n")
+    return results
+
+
+def concurrency_levels(value):
+    return [int(level) for level in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the /vehicle endpoints.")
+    parser.add_argument("--rows", type=int, action="append", help="vehicles to seed; repeat for several sizes (default 10000)")
+    parser.add_argument("--concurrency", type=concurrency_levels, default=[1, 8, 32], help="comma-separated client counts")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per run")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of unmeasured traffic before each run")
+    parser.add_argument("--seed", type=int, default=0, help="traffic RNG seed")
+    parser.add_argument("--server", choices=["inprocess", "gunicorn", "asgi"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--database-url", help="benchmark this database instead of a throwaway cluster")
+    parser.add_argument("--record", help="write the generated requests to this JSON lines file")
+    parser.add_argument("--replay", help="send the requests recorded in this JSON lines file")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of stored results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (default 0.25)")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results in --baseline")
+    args = parser.parse_args(argv)
+    args.rows = args.rows or [10000]
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be combined")
+    if args.record and (len(args.rows) > 1 or len(args.concurrency) > 1):
+        parser.error("--record needs a single --rows and --concurrency")
+
+    if args.database_url:
+        try:
+            results = run(args, args.database_url)
+        finally:
+            clean_up(args.database_url)
+    else:
+        with temporary_postgres() as database_url:
+            results = run(args, database_url)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    if not args.baseline:
+        return 0
+    if args.update_baseline:
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            # Results from another machine are not comparable with these, so start afresh
+            if baseline.get("machine") == machine():
+                stored = baseline["results"]
+        stored.update(
+            (result["name"], {metric: result[metric] for metric in ("rps", "p50_ms", "p95_ms", "p99_ms")})
+            for result in results
+        )
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine(), "results": dict(sorted(stored.items()))}, f, indent=2)
+            f.write("\n")
+        print(f"Stored {len(results)} result(s) in {args.baseline}.")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
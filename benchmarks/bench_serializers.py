@@ -0,0 +1,73 @@
+"""Micro-benchmark: vehicle rows to JSON bytes, dict + jsonify versus RowLayout.
+
+Run from the repository root:
+
+    python benchmarks/bench_serializers.py [rows]
+"""
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from api.serializers import vehicle_layout
+
+
+def make_rows(count):
+    """Build cursor-style tuples resembling vehicles table rows."""
+    return [
+        (
+            f"1HGCM82633A{i:06d}",
+            "Honda",
+            "A reliable sedan with \"quoted\" trim",
+            150 + i % 300,
+            "Accord",
+            1995 + i % 30,
+            Decimal(f"{10000 + i % 50000}.99"),
+            "Gasoline",
+        )
+        for i in range(count)
+    ]
+
+
+def dict_jsonify(rows):
+    """The listing path before the serializer: a dict per row, then jsonify."""
+    vehicles = [
+        {
+            "vin": row[0],
+            "manufacturer_name": row[1],
+            "description": row[2],
+            "horse_power": row[3],
+            "model_name": row[4],
+            "model_year": row[5],
+            "purchase_price": float(row[6]) if row[6] else None,
+            "fuel_type": row[7],
+        }
+        for row in rows
+    ]
+    return jsonify(vehicles).get_data()
+
+
+def row_layout(rows):
+    return vehicle_layout.encode_array(rows)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rows = make_rows(count)
+    app = Flask(__name__)
+    with app.app_context():
+        results = {}
+        for name, encode in [("dict + jsonify", dict_jsonify), ("RowLayout", row_layout)]:
+            runs = timeit.repeat(lambda: encode(rows), number=1, repeat=7)
+            results[name] = min(runs)
+            print(f"{name:>15}: {min(runs) * 1000:8.2f} ms per {count} rows "
+                  f"({count / min(runs):,.0f} rows/s)")
+    print(f"{'speedup':>15}: {results['dict + jsonify'] / results['RowLayout']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark: cold start, from a fresh interpreter to the first responses.
+
+Each run starts a new Python process that imports ``main`` (which creates the
+app), then sends its first requests through the Flask test client: ``GET /``,
+which needs no database, and, when DATABASE_URL is set, ``GET /vehicle/<vin>``,
+which opens the first pooled connection.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, os, time
+start = time.perf_counter()
+import main
+timings = {"import main": time.perf_counter() - start}
+client = main.app.test_client()
+start = time.perf_counter()
+assert client.get("/").status_code == 200
+timings["first GET /"] = time.perf_counter() - start
+if os.getenv("DATABASE_URL"):
+    start = time.perf_counter()
+    assert client.get("/vehicle/BENCHSTARTUP00000").status_code in (200, 404)
+    timings["first GET /vehicle/<vin>"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def run_once():
+    """Time one cold start, returning the child's timings plus the process wall time."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process wall time"] = wall
+    return timings
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    samples = {}
+    for _ in range(runs):
+        for name, seconds in run_once().items():
+            samples.setdefault(name, []).append(seconds)
+
+    print(f"{runs} cold starts (python {sys.version.split()[0]})")
+    for name, values in samples.items():
+        print(f"{name:>28}: median {statistics.median(values) * 1000:7.1f} ms"
+              f"  min {min(values) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
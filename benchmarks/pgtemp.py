@@ -0,0 +1,66 @@
+"""A throwaway PostgreSQL cluster for benchmarks.
+
+The cluster is created with ``initdb`` in a temporary directory, in UTF-8 so
+non-ASCII payloads can be stored, listens on a free local port, and is stopped
+and deleted on exit. The server binaries are taken from ``PG_BIN``, then
+``pg_config --bindir``, then ``PATH``.
+"""
+import contextlib
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+
+
+def find_bindir():
+    """Return the directory holding ``initdb`` and ``pg_ctl``."""
+    bindir = os.getenv("PG_BIN")
+    if bindir:
+        return bindir
+    if shutil.which("pg_config"):
+        bindir = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True, check=True).stdout.strip()
+        if os.path.exists(os.path.join(bindir, "initdb")):
+            return bindir
+    initdb = shutil.which("initdb")
+    if initdb is None:
+        raise RuntimeError("initdb not found; install PostgreSQL or set PG_BIN to its bin directory")
+    return os.path.dirname(initdb)
+
+
+def _run(args):
+    result = subprocess.run(args, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(args[0])} failed: {result.stderr.strip() or result.stdout.strip()}")
+
+
+def free_port():
+    """Return a local TCP port nobody is listening on right now."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def temporary_postgres(max_connections=200, settings=None):
+    """Run a fresh cluster for the duration of a ``with`` block and yield its database URL."""
+    bindir = find_bindir()
+    directory = tempfile.mkdtemp(prefix="vehicles-bench-pg-")
+    data = os.path.join(directory, "data")
+    port = free_port()
+    options = {"max_connections": max_connections, "listen_addresses": "127.0.0.1", "port": port,
+               "unix_socket_directories": directory}
+    options.update(settings or {})
+    try:
+        _run([os.path.join(bindir, "initdb"), "-D", data, "-U", "postgres", "-A", "trust", "-E", "UTF8",
+              "--locale=C.UTF-8", "--no-sync"])
+        _run([os.path.join(bindir, "pg_ctl"), "-D", data, "-l", os.path.join(directory, "postgres.log"), "-w",
+              "-o", " ".join(f"-c {name}={value}" for name, value in options.items()), "start"])
+        try:
+            yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+        finally:
+            subprocess.run(
+                [os.path.join(bindir, "pg_ctl"), "-D", data, "-m", "immediate", "-w", "stop"], capture_output=True,
+            )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+# SERVER_MODE=asgi serves api.asgi on uvicorn's event-loop workers; the
+# default serves the Flask app on gunicorn's sync workers.
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "api.asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "main:app"
+
+
+def on_starting(server):
+    """Give the workers a fresh shared directory for their /metrics snapshots."""
+    directory = os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="vehicles-metrics-"))
+    os.makedirs(directory, exist_ok=True)
+    from api.metrics import clear_metrics_dir
+    clear_metrics_dir(directory)
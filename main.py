@@ -1,6 +1,8 @@
-from api.routes import app
+from api.app import create_app
 import os
 
+app = create_app()
+
 def main():
     """Main entry point for the application."""
     env = os.getenv("ENV", "").strip()
@@ -8,18 +10,29 @@ def main():
 
     if env != "production":
         try:
-            print("Initializing the database...")
-            from api.routes import initialize_database
-            initialize_database()
-            print("Database initialized successfully.")
+            print("Migrating the database...")
+            from api.db import get_db_connection
+            from api.migrations import migrate
+            conn = get_db_connection()
+            try:
+                migrate(conn)
+            finally:
+                conn.close()
+            print("Database schema is up to date.")
         except Exception as e:
-            print(f"Failed to initialize database: {e}")
+            print(f"Failed to migrate database: {e}")
             return  # Exit if database initialization fails
 
-        print("Starting the Flask application...")
-        app.run(debug=False, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
+        port = int(os.environ.get("PORT", 5000))
+        if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+            print("Starting the ASGI application...")
+            import uvicorn
+            uvicorn.run("api.asgi:app", host="0.0.0.0", port=port)
+        else:
+            print("Starting the Flask application...")
+            app.run(debug=False, host="0.0.0.0", port=port)
     else:
-        print("Skipping database initialization in production.")
+        print("Skipping database migrations in production; they run in the release phase.")
         # Do not call app.run() here
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+import os
+
+import psycopg2
+import pytest
+from dotenv import load_dotenv
+
+from api.bulk import BulkLoader
+from api.stats import RETURNING_STATS, STATS_COLUMNS, StatsDelta, check_stats
+
+# Load environment variables from .env file
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL is not set")
+
+VEHICLE = {"manufacturer_name": "BulkStats", "description": None, "horse_power": 90, "model_name": "Model",
+           "model_year": 1805, "purchase_price": 1000, "fuel_type": "Gasoline"}
+
+@pytest.fixture
+def conns():
+    """Two connections: one loading in a transaction that is rolled back, one writing concurrently."""
+    from api.migrations import migrate
+
+    loading, other = psycopg2.connect(DATABASE_URL), psycopg2.connect(DATABASE_URL)
+    migrate(loading)
+    yield loading, other
+    loading.rollback()
+    with other.cursor() as cursor:
+        cursor.execute("DELETE FROM vehicles_schema.vehicles WHERE vin LIKE 'BULKSTATS%'" + RETURNING_STATS + ";")
+        stats = StatsDelta()
+        for row in cursor.fetchall():
+            stats.remove(row)
+        stats.apply(cursor)
+    other.commit()
+    loading.close()
+    other.close()
+
+def test_upsert_counts_a_vin_committed_concurrently_once(conns):
+    """A VIN another transaction commits between the upsert's lock and its write still has its old values uncounted."""
+    loading, other = conns
+    cursor = loading.cursor()
+    loader = BulkLoader(cursor)
+    for i, vin in enumerate(["BULKSTATS00000001", "BULKSTATS00000002"]):
+        loader.add(i, dict(VEHICLE, vin=vin, purchase_price=2000))
+
+    existing_rows = loader.existing_rows
+
+    def insert_after_locking(columns):
+        rows = existing_rows(columns)
+        if loader.existing_rows is insert_after_locking:
+            loader.existing_rows = existing_rows
+            with other.cursor() as other_cursor:
+                other_cursor.execute(
+                    "INSERT INTO vehicles_schema.vehicles (vin, " + ", ".join(VEHICLE) + ")"
+                    " VALUES ('BULKSTATS00000002', %s, %s, %s, %s, %s, %s, %s)" + RETURNING_STATS + ";",
+                    list(VEHICLE.values()),
+                )
+                stats = StatsDelta()
+                stats.add(other_cursor.fetchone())
+                stats.apply(other_cursor)
+            other.commit()
+        return rows
+
+    loader.existing_rows = insert_after_locking
+    inserted, updated, previous = loader.upsert(STATS_COLUMNS)
+    assert (inserted, updated) == (1, 1)
+    assert previous == [tuple(VEHICLE[column] for column in STATS_COLUMNS[:3]) + (1000, 90)]
+
+    stats = StatsDelta()
+    for row in previous:
+        stats.remove(row)
+    for row in loader.staged_rows(STATS_COLUMNS):
+        stats.add(row)
+    stats.apply(cursor)
+    assert check_stats(cursor) == []
@@ -0,0 +1,45 @@
+import os
+
+import psycopg2
+import pytest
+from dotenv import load_dotenv
+
+import api.changes
+from api.changes import ChangeFeed, iter_stream
+
+# Load environment variables from .env file
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL is not set")
+
+@pytest.fixture
+def newest_change():
+    """The position of the newest logged change, or (0, 0) if there is none."""
+    from api.migrations import migrate
+
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        migrate(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT xid, id FROM vehicles_schema.vehicle_changes ORDER BY xid DESC, id DESC LIMIT 1;")
+            return cursor.fetchone() or (0, 0)
+    finally:
+        conn.close()
+
+def test_resume_from_before_the_buffer_blocks(monkeypatch, newest_change):
+    """A subscriber resuming from before the buffer, with nothing logged since, waits rather than re-querying."""
+    feed = ChangeFeed(idle_interval=3600.0)
+    floor = feed.start()
+    assert newest_change < floor
+
+    queries = []
+    read_changes = api.changes.read_changes
+    monkeypatch.setattr(api.changes, "read_changes", lambda *args: queries.append(args) or read_changes(*args))
+    monkeypatch.setattr(api.changes, "change_feed", feed)
+
+    assert feed.read(newest_change) == ([], floor)
+    queries.clear()
+    assert list(iter_stream(newest_change, b"", max_seconds=0.5)) == [b"", b": keepalive\n\n"]
+    assert len(queries) == 1
@@ -0,0 +1,42 @@
+import os
+
+import psycopg2
+import pytest
+from dotenv import load_dotenv
+
+from api.migrations import SCHEMA_VERSION, migrate, schema_version
+
+# Load environment variables from .env file
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL is not set")
+
+@pytest.fixture
+def conn():
+    conn = psycopg2.connect(DATABASE_URL)
+    yield conn
+    conn.rollback()
+    conn.close()
+
+def test_migrate_is_recorded_and_idempotent(conn):
+    migrate(conn)
+    with conn.cursor() as cursor:
+        assert schema_version(cursor) == SCHEMA_VERSION
+        cursor.execute("SELECT version FROM vehicles_schema.schema_migrations ORDER BY version;")
+        assert [row[0] for row in cursor.fetchall()] == list(range(1, SCHEMA_VERSION + 1))
+    conn.rollback()
+
+    # An up-to-date database only has its version checked
+    assert migrate(conn) == []
+
+def test_migrate_adopts_a_database_without_a_ledger(conn):
+    migrate(conn)
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TABLE vehicles_schema.schema_migrations;")
+    conn.commit()
+
+    assert migrate(conn) == list(range(1, SCHEMA_VERSION + 1))
+    with conn.cursor() as cursor:
+        assert schema_version(cursor) == SCHEMA_VERSION
@@ -0,0 +1,87 @@
+import os
+
+import psycopg2
+import pytest
+from dotenv import load_dotenv
+from psycopg2 import sql
+
+from api.queries import build_vehicle_query, decode_cursor, parse_sort, parse_vehicle_filters
+
+# Load environment variables from .env file
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL is not set")
+
+SEED_ROWS = 20000
+
+@pytest.fixture(scope="module")
+def seeded_cursor():
+    """A cursor inside a transaction holding a seeded, analyzed vehicles table.
+
+    The transaction is rolled back afterwards, removing the seeded rows.
+    """
+    from api.migrations import migrate
+
+    conn = psycopg2.connect(DATABASE_URL)
+    migrate(conn)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO vehicles_schema.vehicles
+            (vin, manufacturer_name, description, horse_power, model_name, model_year, purchase_price, fuel_type)
+        SELECT 'PLAN' || lpad(g::text, 13, '0'),
+               'PlanMaker' || (g %% 200),
+               'Seeded for query plan tests',
+               100 + g %% 400,
+               'PlanModel' || (g %% 500),
+               1990 + g %% 35,
+               5000 + (g %% 9000) * 10.5,
+               (ARRAY['Gasoline', 'Diesel', 'Hybrid', 'Electric'])[1 + g %% 4]
+        FROM generate_series(1, %s) AS g;
+    """, (SEED_ROWS,))
+    cursor.execute("ANALYZE vehicles_schema.vehicles;")
+    yield cursor
+    conn.rollback()
+    conn.close()
+
+def plan_node_types(plan):
+    """Collect the node types of an EXPLAIN (FORMAT JSON) plan tree."""
+    types = [plan["Node Type"]]
+    for child in plan.get("Plans", []):
+        types.extend(plan_node_types(child))
+    return types
+
+def explain(cursor, args, limit=100):
+    """Return the plan node types for the listing query built from ``args``."""
+    filters, errors = parse_vehicle_filters(args)
+    assert not errors
+    sort = parse_sort(args.get("sort"))
+    after = decode_cursor(args["after"], sort[0]) if "after" in args else None
+    query, params = build_vehicle_query(filters, sort, after, limit)
+    cursor.execute(sql.SQL("EXPLAIN (FORMAT JSON) ") + query, params)
+    return plan_node_types(cursor.fetchone()[0][0]["Plan"])
+
+@pytest.mark.parametrize("args", [
+    {"manufacturer_name": "PlanMaker7"},
+    {"model_name": "PlanModel42"},
+    {"fuel_type": "Diesel"},
+    {"model_year_min": "2020", "model_year_max": "2021"},
+    {"purchase_price_min": "10000", "purchase_price_max": "10100"},
+    {"manufacturer_name": "PlanMaker7", "model_year_min": "2010", "model_year_max": "2012"},
+    {"sort": "-model_year"},
+    {"sort": "manufacturer_name", "fuel_type": "Hybrid"},
+    {"after": "PLAN0000000010000"},
+])
+def test_filtered_page_avoids_sequential_scan(seeded_cursor, args):
+    """Test that each filtered, sorted page is answered from an index."""
+    assert "Seq Scan" not in explain(seeded_cursor, args)
+
+@pytest.mark.parametrize("args", [
+    {"manufacturer_name": "PlanMaker7"},
+    {"model_name": "PlanModel42"},
+    {"manufacturer_name": "PlanMaker7", "model_year_min": "2010", "model_year_max": "2012"},
+])
+def test_selective_stream_avoids_sequential_scan(seeded_cursor, args):
+    """Test that selective unpaginated listings are answered from an index."""
+    assert "Seq Scan" not in explain(seeded_cursor, args, limit=None)
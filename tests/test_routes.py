@@ -1,6 +1,9 @@
+import io
+import json
 import pytest
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -47,6 +50,22 @@ def test_create_vehicle(sample_vehicle):
     assert response.status_code == 201
     assert response.json()["message"] == "Vehicle added successfully"
 
+def test_create_duplicate_vehicle(sample_vehicle):
+    """Test that creating a vehicle whose VIN exists is a conflict."""
+    requests.post(f"{BASE_URL}/vehicle", json=sample_vehicle)
+    response = requests.post(f"{BASE_URL}/vehicle", json=sample_vehicle)
+    assert response.status_code == 409
+    assert response.json()["error"] == "Conflict"
+
+def test_create_vehicles_concurrently(bulk_vehicles):
+    """Test that concurrent creates, as grouped by group commit, each get their own status."""
+    payloads = bulk_vehicles + [bulk_vehicles[0], bulk_vehicles[1], dict(bulk_vehicles[2], vin=55555)]
+    with ThreadPoolExecutor(len(payloads)) as executor:
+        statuses = list(executor.map(lambda vehicle: requests.post(f"{BASE_URL}/vehicle", json=vehicle).status_code, payloads))
+    assert sorted(statuses) == [201] * len(bulk_vehicles) + [409, 409, 422]
+    for vehicle in bulk_vehicles:
+        assert requests.get(f"{BASE_URL}/vehicle/{vehicle['vin']}").status_code == 200
+
 def test_create_vehicle_with_malformed_json():
     """Test creating a vehicle with malformed JSON."""
     headers = {'Content-Type': 'application/json'}
@@ -80,6 +99,17 @@ def test_create_vehicle_with_invalid_data_types():
     assert "model_year" in response.json()["details"]
     assert response.json()["details"]["model_year"] == "'model_year' must be an integer."
 
+def test_create_vehicle_with_values_the_table_rejects(sample_vehicle):
+    """Test that a non-string VIN or an over-long field is a validation error, not a database one."""
+    response = requests.post(f"{BASE_URL}/vehicle", json=dict(sample_vehicle, vin=55555))
+    assert response.status_code == 422
+    assert response.json()["details"]["vin"] == "'vin' must be a string."
+    assert requests.get(f"{BASE_URL}/vehicle/55555").status_code == 404
+
+    response = requests.post(f"{BASE_URL}/vehicle", json=dict(sample_vehicle, vin="X" * 18))
+    assert response.status_code == 422
+    assert "vin" in response.json()["details"]
+
 def test_get_vehicle_by_vin(sample_vehicle):
     """Test retrieving a vehicle by VIN."""
     vin = sample_vehicle["vin"]
@@ -139,3 +169,376 @@ def test_delete_vehicle_not_found():
     response = requests.delete(f"{BASE_URL}/vehicle/{non_existent_vin}")
     assert response.status_code == 404
     assert response.json()["error"] == "Vehicle not found"
+
+def test_pool_stats():
+    """Test the connection pool statistics endpoint."""
+    requests.get(f"{BASE_URL}/vehicle")
+    response = requests.get(f"{BASE_URL}/pool/stats")
+    assert response.status_code == 200
+    stats = response.json()
+    for key in ["size", "idle", "in_use", "waiting", "max_size", "acquire_time_avg_ms"]:
+        assert key in stats
+    assert stats["size"] <= stats["max_size"]
+
+@pytest.fixture
+def paged_vehicles(sample_vehicle):
+    """Three vehicles with adjacent VINs, removed after the test."""
+    vins = [f"PAGETEST00000000{i}" for i in range(1, 4)]
+    for vin in vins:
+        requests.delete(f"{BASE_URL}/vehicle/{vin}")
+        requests.post(f"{BASE_URL}/vehicle", json=dict(sample_vehicle, vin=vin))
+    yield vins
+    for vin in vins:
+        requests.delete(f"{BASE_URL}/vehicle/{vin}")
+
+def test_get_vehicles_streams_collection(paged_vehicles):
+    """Test fetching the whole collection as JSON and as NDJSON."""
+    response = requests.get(f"{BASE_URL}/vehicle")
+    assert response.status_code == 200
+    vins = [vehicle["vin"] for vehicle in response.json()]
+    assert set(paged_vehicles) <= set(vins)
+
+    response = requests.get(f"{BASE_URL}/vehicle", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("application/x-ndjson")
+    lines = [line for line in response.text.split("\n") if line]
+    assert len(lines) == len(vins)
+
+def test_get_vehicles_keyset_pagination(paged_vehicles):
+    """Test paging through vehicles with limit/after and the next link."""
+    response = requests.get(f"{BASE_URL}/vehicle", params={"limit": 2, "after": "PAGETEST000000000"})
+    assert response.status_code == 200
+    assert [vehicle["vin"] for vehicle in response.json()] == paged_vehicles[:2]
+    assert response.links["next"]["url"]
+
+    response = requests.get(f"{BASE_URL}{response.links['next']['url']}")
+    assert response.status_code == 200
+    assert response.json()[0]["vin"] == paged_vehicles[2]
+
+def test_get_vehicles_conditional_and_compressed(paged_vehicles):
+    """Test the collection's ETag, 304 for an unchanged collection, and the gzip copy."""
+    response = requests.get(f"{BASE_URL}/vehicle", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    etag = response.headers["ETag"]
+    assert requests.get(f"{BASE_URL}/vehicle", headers={"If-None-Match": etag}).status_code == 304
+
+    plain = requests.get(f"{BASE_URL}/vehicle", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["ETag"] != etag
+    assert plain.json() == response.json()
+
+    requests.delete(f"{BASE_URL}/vehicle/{paged_vehicles[0]}")
+    response = requests.get(f"{BASE_URL}/vehicle", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert paged_vehicles[0] not in [vehicle["vin"] for vehicle in response.json()]
+
+def test_get_vehicles_invalid_limit():
+    """Test paging with an out-of-range limit."""
+    response = requests.get(f"{BASE_URL}/vehicle", params={"limit": 0})
+    assert response.status_code == 400
+    assert response.json()["error"] == "Bad Request"
+
+def test_get_vehicle_after_create_is_not_stale(sample_vehicle):
+    """Test that a cached 'not found' is invalidated when the vehicle is created."""
+    vin = "CACHETEST00000001"
+    requests.delete(f"{BASE_URL}/vehicle/{vin}")
+    assert requests.get(f"{BASE_URL}/vehicle/{vin}").status_code == 404
+
+    requests.post(f"{BASE_URL}/vehicle", json=dict(sample_vehicle, vin=vin))
+    response = requests.get(f"{BASE_URL}/vehicle/{vin}")
+    assert response.status_code == 200
+    assert response.json()["vin"] == vin
+
+    requests.put(f"{BASE_URL}/vehicle/{vin}", json={"description": "Cache test"})
+    assert requests.get(f"{BASE_URL}/vehicle/{vin}").json()["description"] == "Cache test"
+    requests.delete(f"{BASE_URL}/vehicle/{vin}")
+
+def test_cache_stats():
+    """Test the VIN cache statistics endpoint."""
+    response = requests.get(f"{BASE_URL}/cache/stats")
+    assert response.status_code == 200
+    for key in ["size", "hits", "negative_hits", "misses", "evictions"]:
+        assert key in response.json()
+
+@pytest.fixture
+def bulk_vehicles(sample_vehicle):
+    """Five vehicles for the bulk endpoint, removed after the test."""
+    vehicles = [dict(sample_vehicle, vin=f"BULKTEST00000000{i}") for i in range(5)]
+    for vehicle in vehicles:
+        requests.delete(f"{BASE_URL}/vehicle/{vehicle['vin']}")
+    yield vehicles
+    for vehicle in vehicles:
+        requests.delete(f"{BASE_URL}/vehicle/{vehicle['vin']}")
+
+def test_bulk_create_vehicles(bulk_vehicles):
+    """Test bulk loading with rejected and duplicated rows."""
+    payload = bulk_vehicles[:3] + [{"vin": "BULKTEST00000000X"}, bulk_vehicles[0]]
+    response = requests.post(f"{BASE_URL}/vehicle/bulk", json=payload)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["received"] == 5
+    assert report["inserted"] == 3
+    assert [row["index"] for row in report["rejected"]] == [3, 4]
+    assert "model_year" in report["rejected"][0]["details"]
+    assert requests.get(f"{BASE_URL}/vehicle/{bulk_vehicles[2]['vin']}").status_code == 200
+
+def test_bulk_create_vehicles_conflict_policies(bulk_vehicles):
+    """Test the fail, skip and upsert policies for existing VINs."""
+    requests.post(f"{BASE_URL}/vehicle/bulk", json=bulk_vehicles[:2])
+
+    response = requests.post(f"{BASE_URL}/vehicle/bulk", json=bulk_vehicles[1:4])
+    assert response.status_code == 409
+    assert response.json()["duplicates"] == [0]
+    assert requests.get(f"{BASE_URL}/vehicle/{bulk_vehicles[2]['vin']}").status_code == 404
+
+    response = requests.post(f"{BASE_URL}/vehicle/bulk", params={"on_conflict": "skip"}, json=bulk_vehicles[1:4])
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 2
+    assert response.json()["skipped"] == 1
+
+    changed = [dict(vehicle, description="Bulk upsert") for vehicle in bulk_vehicles]
+    body = "\n".join(json.dumps(vehicle) for vehicle in changed)
+    response = requests.post(f"{BASE_URL}/vehicle/bulk", params={"on_conflict": "upsert"}, data=body,
+                             headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 1
+    assert response.json()["updated"] == 4
+    assert requests.get(f"{BASE_URL}/vehicle/{bulk_vehicles[0]['vin']}").json()["description"] == "Bulk upsert"
+
+def test_get_vehicles_filtered_and_sorted(bulk_vehicles):
+    """Test filtering by manufacturer and year range and sorting by year."""
+    vehicles = [dict(vehicle, manufacturer_name="FilterTestMaker", model_year=2000 + i)
+                for i, vehicle in enumerate(bulk_vehicles)]
+    requests.post(f"{BASE_URL}/vehicle/bulk", json=vehicles)
+
+    params = {"manufacturer_name": "FilterTestMaker", "model_year_min": 2001, "model_year_max": 2003, "sort": "-model_year"}
+    response = requests.get(f"{BASE_URL}/vehicle", params=params)
+    assert response.status_code == 200
+    assert [vehicle["model_year"] for vehicle in response.json()] == [2003, 2002, 2001]
+
+    response = requests.get(f"{BASE_URL}/vehicle", params=dict(params, limit=2))
+    assert [vehicle["model_year"] for vehicle in response.json()] == [2003, 2002]
+    response = requests.get(f"{BASE_URL}{response.links['next']['url']}")
+    assert [vehicle["model_year"] for vehicle in response.json()] == [2001]
+
+def test_get_vehicles_invalid_filters():
+    """Test listing with malformed filter and sort parameters."""
+    response = requests.get(f"{BASE_URL}/vehicle", params={"model_year_min": "recent", "sort": "description"})
+    assert response.status_code == 400
+    assert "model_year_min" in response.json()["details"]
+    assert "sort" in response.json()["details"]
+
+def test_get_vehicle_with_zero_price(sample_vehicle):
+    """Test that a purchase price of 0 is returned as 0, not null."""
+    vin = "ZEROPRICE00000001"
+    requests.delete(f"{BASE_URL}/vehicle/{vin}")
+    requests.post(f"{BASE_URL}/vehicle", json=dict(sample_vehicle, vin=vin, purchase_price=0))
+    response = requests.get(f"{BASE_URL}/vehicle/{vin}")
+    assert response.status_code == 200
+    assert response.json()["purchase_price"] == 0
+    requests.delete(f"{BASE_URL}/vehicle/{vin}")
+
+def test_get_vehicle_stats(bulk_vehicles):
+    """Test that the fleet statistics follow creates, updates and deletes."""
+    vehicles = [dict(vehicle, manufacturer_name="StatsTestMaker", model_year=1901, horse_power=100 + i * 10,
+                     purchase_price=1000 + i * 100) for i, vehicle in enumerate(bulk_vehicles)]
+    requests.post(f"{BASE_URL}/vehicle/bulk", json=vehicles[:4])
+    requests.post(f"{BASE_URL}/vehicle", json=vehicles[4])
+
+    def stats_for_1901():
+        stats = requests.get(f"{BASE_URL}/vehicle/stats").json()
+        years = [year for year in stats["by_model_year"] if year["model_year"] == 1901]
+        return stats, years[0] if years else None
+
+    stats, year = stats_for_1901()
+    assert stats["by_manufacturer"]["StatsTestMaker"] == 5
+    assert year["count"] == 5
+    assert year["purchase_price"] == {"avg": 1200.0, "min": 1000.0, "max": 1400.0}
+    assert year["horse_power"] == {"avg": 120.0, "min": 100.0, "max": 140.0}
+
+    requests.put(f"{BASE_URL}/vehicle/{vehicles[4]['vin']}", json={"purchase_price": 500, "horse_power": None})
+    requests.delete(f"{BASE_URL}/vehicle/{vehicles[0]['vin']}")
+    stats, year = stats_for_1901()
+    assert stats["by_manufacturer"]["StatsTestMaker"] == 4
+    assert year["purchase_price"] == {"avg": 1025.0, "min": 500.0, "max": 1300.0}
+    assert year["horse_power"] == {"avg": 120.0, "min": 110.0, "max": 130.0}
+
+    for vehicle in vehicles:
+        requests.delete(f"{BASE_URL}/vehicle/{vehicle['vin']}")
+    stats, year = stats_for_1901()
+    assert "StatsTestMaker" not in stats["by_manufacturer"]
+    assert year is None
+
+def test_metrics(sample_vehicle):
+    """Test that requests are counted and timed by route and phase."""
+    requests.get(f"{BASE_URL}/vehicle/{sample_vehicle['vin']}")
+    response = requests.get(f"{BASE_URL}/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    lines = response.text.splitlines()
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+    assert any(line.startswith('http_requests_total{method="GET",route="/vehicle/<string:vin>",status="')
+               for line in lines)
+    assert any(line.startswith('http_request_phase_seconds_count{route="/vehicle/<string:vin>",phase="acquire"}')
+               for line in lines)
+
+def test_patch_vehicle_with_etag(sample_vehicle):
+    """Test PATCH returning the updated vehicle and If-Match rejecting stale ETags."""
+    vin = "ETAGTEST000000001"
+    requests.delete(f"{BASE_URL}/vehicle/{vin}")
+    requests.post(f"{BASE_URL}/vehicle", json=dict(sample_vehicle, vin=vin))
+    etag = requests.get(f"{BASE_URL}/vehicle/{vin}").headers["ETag"]
+
+    response = requests.patch(f"{BASE_URL}/vehicle/{vin}", json={"horse_power": 250}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["vehicle"]["horse_power"] == 250
+    assert response.json()["vehicle"]["description"] == sample_vehicle["description"]
+    new_etag = response.headers["ETag"]
+    assert new_etag != etag
+    assert requests.get(f"{BASE_URL}/vehicle/{vin}").headers["ETag"] == new_etag
+
+    response = requests.patch(f"{BASE_URL}/vehicle/{vin}", json={"horse_power": 260}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    assert response.headers["ETag"] == new_etag
+    assert requests.get(f"{BASE_URL}/vehicle/{vin}").json()["horse_power"] == 250
+
+    # Non-ASCII digits and versions past BIGINT are not ETags the API issues
+    for tag in ['"\xb2"', '"' + "9" * 30 + '"']:
+        response = requests.patch(f"{BASE_URL}/vehicle/{vin}", json={"horse_power": 270}, headers={"If-Match": tag})
+        assert response.status_code == 412
+        assert requests.delete(f"{BASE_URL}/vehicle/{vin}", headers={"If-Match": tag}).status_code == 412
+    assert requests.delete(f"{BASE_URL}/vehicle/{vin}", headers={"If-Match": new_etag}).status_code == 204
+
+def test_update_vehicle_validates_before_lookup():
+    """Test that invalid updates are rejected even for unknown VINs, and cleared required fields too."""
+    response = requests.patch(f"{BASE_URL}/vehicle/NOSUCHVIN00000001", json={"model_year": "soon"})
+    assert response.status_code == 422
+    response = requests.patch(f"{BASE_URL}/vehicle/NOSUCHVIN00000001", json={"model_name": None})
+    assert response.status_code == 422
+    assert "model_name" in response.json()["details"]
+    response = requests.patch(f"{BASE_URL}/vehicle/NOSUCHVIN00000001", json={"model_year": 2020})
+    assert response.status_code == 404
+
+def test_lookup_vehicles(bulk_vehicles):
+    """Test looking up several VINs, including missing and repeated ones, in one request."""
+    requests.post(f"{BASE_URL}/vehicle/bulk", json=bulk_vehicles[:2])
+    vins = [bulk_vehicles[1]["vin"], bulk_vehicles[4]["vin"], bulk_vehicles[0]["vin"], bulk_vehicles[1]["vin"]]
+    response = requests.post(f"{BASE_URL}/vehicle/lookup", json={"vins": vins})
+    assert response.status_code == 200
+    result = response.json()
+    assert list(result["vehicles"]) == [bulk_vehicles[1]["vin"], bulk_vehicles[0]["vin"]]
+    assert result["vehicles"][bulk_vehicles[0]["vin"]] == requests.get(f"{BASE_URL}/vehicle/{bulk_vehicles[0]['vin']}").json()
+    assert result["missing"] == [bulk_vehicles[4]["vin"]]
+
+    response = requests.post(f"{BASE_URL}/vehicle/lookup", json={"vins": "not a list"})
+    assert response.status_code == 400
+
+def test_delete_vehicles(bulk_vehicles):
+    """Test deleting several VINs in one request."""
+    requests.post(f"{BASE_URL}/vehicle/bulk", json=bulk_vehicles[:3])
+    assert requests.get(f"{BASE_URL}/vehicle/{bulk_vehicles[0]['vin']}").status_code == 200  # cached
+    vins = [bulk_vehicles[0]["vin"], bulk_vehicles[4]["vin"], bulk_vehicles[2]["vin"]]
+    response = requests.post(f"{BASE_URL}/vehicle/delete", json={"vins": vins})
+    assert response.status_code == 200
+    assert response.json() == {"deleted": [vins[0], vins[2]], "missing": [vins[1]]}
+    assert requests.get(f"{BASE_URL}/vehicle/{bulk_vehicles[0]['vin']}").status_code == 404
+    assert requests.get(f"{BASE_URL}/vehicle/{bulk_vehicles[1]['vin']}").status_code == 200
+
+def test_export_vehicles(bulk_vehicles):
+    """Test exporting filtered vehicles as CSV and as gzipped NDJSON."""
+    vehicles = [dict(vehicle, manufacturer_name="ExportTest") for vehicle in bulk_vehicles[:3]]
+    requests.post(f"{BASE_URL}/vehicle/bulk", json=vehicles)
+
+    response = requests.get(f"{BASE_URL}/vehicle/export", params={"manufacturer_name": "ExportTest"})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0].split(",")[:2] == ["vin", "manufacturer_name"]
+    assert [line.split(",")[0] for line in lines[1:]] == [vehicle["vin"] for vehicle in vehicles]
+
+    response = requests.get(f"{BASE_URL}/vehicle/export", params={"format": "ndjson", "manufacturer_name": "ExportTest", "sort": "-vin"},
+                            headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert exported == [requests.get(f"{BASE_URL}/vehicle/{vehicle['vin']}").json() for vehicle in reversed(vehicles)]
+
+    response = requests.get(f"{BASE_URL}/vehicle/export", params={"format": "xml"})
+    assert response.status_code == 400
+
+def test_export_vehicles_head_holds_no_connection():
+    """Test that HEAD requests for an export, whose body is never read, leave the pool free."""
+    for _ in range(3):
+        response = requests.head(f"{BASE_URL}/vehicle/export", params={"format": "ndjson"})
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("application/x-ndjson")
+    assert requests.get(f"{BASE_URL}/pool/stats").json()["in_use"] == 0
+
+def test_export_vehicles_writes_non_ascii_as_utf8(bulk_vehicles):
+    """Test that NDJSON exports write non-ASCII text as UTF-8, where the listing escapes it."""
+    vehicle = dict(bulk_vehicles[0], manufacturer_name="ExportTest", description="\u0160koda \u00fc")
+    assert requests.post(f"{BASE_URL}/vehicle", json=vehicle).status_code == 201
+
+    response = requests.get(f"{BASE_URL}/vehicle/export", params={"format": "ndjson", "manufacturer_name": "ExportTest"})
+    assert response.status_code == 200
+    assert '"description":"\u0160koda \u00fc"'.encode() in response.content
+    listed = requests.get(f"{BASE_URL}/vehicle/{vehicle['vin']}")
+    assert b'"description":"\\u0160koda \\u00fc"' in listed.content
+    assert json.loads(response.content) == listed.json()
+
+def test_export_vehicles_as_parquet(bulk_vehicles):
+    """Test exporting vehicles as a Parquet file."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    vehicles = [dict(vehicle, manufacturer_name="ExportTest") for vehicle in bulk_vehicles[:2]]
+    requests.post(f"{BASE_URL}/vehicle/bulk", json=vehicles)
+
+    response = requests.get(f"{BASE_URL}/vehicle/export", params={"format": "parquet", "manufacturer_name": "ExportTest"})
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.column("vin").to_pylist() == [vehicle["vin"] for vehicle in vehicles]
+    assert table.column("model_year").to_pylist() == [vehicle["model_year"] for vehicle in vehicles]
+
+def _read_change_events(response, vin, count):
+    """Read Server-Sent Events from a change stream until ``count`` of them are about ``vin``."""
+    events = []
+    event = {}
+    for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+        if line.startswith("id: "):
+            event["id"] = line[4:]
+        elif line.startswith("data: "):
+            event["data"] = json.loads(line[6:])
+        elif not line and event:
+            if event.get("data", {}).get("vin") == vin:
+                events.append(event)
+                if len(events) == count:
+                    return events
+            event = {}
+    return events
+
+def test_vehicle_changes_stream_and_resume(sample_vehicle):
+    """Test that writes are pushed to a change stream and that a stream resumes after Last-Event-ID."""
+    vin = sample_vehicle["vin"]
+    requests.delete(f"{BASE_URL}/vehicle/{vin}")
+
+    with requests.get(f"{BASE_URL}/vehicle/changes", stream=True, timeout=10) as response:
+        if response.status_code == 503:
+            assert response.json()["error"] == "Service Unavailable"
+            pytest.skip("change streams are refused by sync workers")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/event-stream")
+        requests.post(f"{BASE_URL}/vehicle", json=sample_vehicle)
+        requests.patch(f"{BASE_URL}/vehicle/{vin}", json={"horse_power": 321})
+        requests.delete(f"{BASE_URL}/vehicle/{vin}")
+        events = _read_change_events(response, vin, 3)
+    assert [event["data"]["op"] for event in events] == ["insert", "update", "delete"]
+    assert events[2]["data"]["vehicle"] is None
+
+    headers = {"Last-Event-ID": events[0]["id"]}
+    with requests.get(f"{BASE_URL}/vehicle/changes", headers=headers, stream=True, timeout=10) as response:
+        resumed = _read_change_events(response, vin, 2)
+    assert [event["id"] for event in resumed] == [events[1]["id"], events[2]["id"]]
+
+    response = requests.get(f"{BASE_URL}/vehicle/changes", headers={"Last-Event-ID": "not-an-id"})
+    assert response.status_code == 400
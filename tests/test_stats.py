@@ -0,0 +1,90 @@
+import os
+import random
+from decimal import Decimal
+
+import psycopg2
+import pytest
+from dotenv import load_dotenv
+
+from api.stats import RETURNING_STATS, STATS_COLUMNS, StatsDelta, check_stats
+
+# Load environment variables from .env file
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL is not set")
+
+@pytest.fixture
+def cursor():
+    """A cursor inside a transaction that is rolled back afterwards."""
+    from api.migrations import migrate
+
+    conn = psycopg2.connect(DATABASE_URL)
+    migrate(conn)
+    cursor = conn.cursor()
+    yield cursor
+    conn.rollback()
+    conn.close()
+
+def random_vehicle(rng):
+    return (
+        rng.choice(["StatsA", "StatsB", "StatsC"]),
+        rng.choice(["Gasoline", "Diesel"]),
+        rng.randint(1800, 1803),
+        rng.choice([None, Decimal(rng.randint(100, 999)) / 4]),
+        rng.choice([None, rng.randint(50, 60)]),
+    )
+
+def test_incremental_stats_match_full_aggregation(cursor):
+    """Random inserts, updates and deletes keep the summary tables equal to a rebuild."""
+    rng = random.Random(8)
+    vins = []
+    for step in range(300):
+        stats = StatsDelta()
+        action = rng.random()
+        if action < 0.5 or not vins:
+            vin = f"STATS{step:012d}"
+            cursor.execute(
+                "INSERT INTO vehicles_schema.vehicles (vin, model_name, " + ", ".join(STATS_COLUMNS) + ")"
+                " VALUES (%s, 'StatsModel', %s, %s, %s, %s, %s)" + RETURNING_STATS + ";",
+                (vin,) + random_vehicle(rng),
+            )
+            stats.add(cursor.fetchone())
+            vins.append(vin)
+        elif action < 0.8:
+            vin = rng.choice(vins)
+            cursor.execute("SELECT " + ", ".join(STATS_COLUMNS) + " FROM vehicles_schema.vehicles WHERE vin = %s;", (vin,))
+            old = cursor.fetchone()
+            cursor.execute(
+                "UPDATE vehicles_schema.vehicles SET (" + ", ".join(STATS_COLUMNS) + ") = ROW(%s, %s, %s, %s, %s)"
+                " WHERE vin = %s" + RETURNING_STATS + ";",
+                random_vehicle(rng) + (vin,),
+            )
+            stats.replace(old, cursor.fetchone())
+        else:
+            vin = vins.pop(rng.randrange(len(vins)))
+            cursor.execute("DELETE FROM vehicles_schema.vehicles WHERE vin = %s" + RETURNING_STATS + ";", (vin,))
+            stats.remove(cursor.fetchone())
+        stats.apply(cursor)
+
+    assert check_stats(cursor) == []
+
+def test_deleting_a_years_last_unmeasured_vehicle_removes_the_year(cursor):
+    """A year whose last vehicle had no price or horse power is dropped from the summary when it is deleted."""
+    stats = StatsDelta()
+    cursor.execute(
+        "INSERT INTO vehicles_schema.vehicles (vin, model_name, " + ", ".join(STATS_COLUMNS) + ")"
+        " VALUES ('STATSNULL00000001', 'StatsModel', 'StatsA', 'Gasoline', 1804, NULL, NULL)" + RETURNING_STATS + ";"
+    )
+    stats.add(cursor.fetchone())
+    stats.apply(cursor)
+
+    stats = StatsDelta()
+    cursor.execute("DELETE FROM vehicles_schema.vehicles WHERE vin = 'STATSNULL00000001'" + RETURNING_STATS + ";")
+    stats.remove(cursor.fetchone())
+    stats.apply(cursor)
+
+    cursor.execute("SELECT count(*) FROM vehicles_schema.vehicle_year_stats WHERE model_year = 1804;")
+    assert cursor.fetchone()[0] == 0
+    assert check_stats(cursor) == []